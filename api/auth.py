@@ -55,14 +55,13 @@ def login_required(function):
 
 @auth_api.route("/register", methods=["POST"])
 @rate_limit(ip_based=True)
-@Request.json("username: str", "password: str", "display_name: str", "email: str", "phone: str")
+@Request.json("username: str(..30)", "password: str", "display_name: str(..30)", "email: str(..50)", "phone: str(..10)",
+              messages={ "username": "Username invalid.", "display_name": "Display name invalid.",
+                         "email": "Email invalid.", "phone": "Phone invalid." })
 def register(username, password, display_name, email, phone, **kwargs):
     try:
 
-        if len(username) > 30                   : raise DataInvalidException("Username")
-        if len(display_name) > 30               : raise DataInvalidException("Display name")
-        if len(email) > 50 or ('@' not in email): raise DataInvalidException("Email")
-        if len(phone) > 10                      : raise DataInvalidException("Phone")
+        if '@' not in email: raise DataInvalidException("Email")
         int(phone)  # Check phone composed by pure numbers
 
         flask_logger.info(f"IP '{kwargs['remote_addr']}' tries to register with username '{username}'.")
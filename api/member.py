@@ -1,22 +1,31 @@
 ''' Libraries '''
+import json
+import queue
 from datetime import datetime
 import logging
 flask_logger = logging.getLogger(name="flask")
 import hashlib
-from flask import Blueprint, request
+from functools import partial
+from flask import Blueprint, Response, request
 
 from utils.exceptions import *
 from api.auth import login_required
 from api.utils.rate_limit import rate_limit
 from api.utils.request import Request
+from api.utils.pagination import encode_cursor, decode_cursor, page_limit
+from api.utils.pubsub import notification_hub, notification_message
 from api.utils.response import *
 from database.model import ProductEntity, NotificationEntity
+from database.importer import PRODUCT_SCHEMA, IMPORT_MAX_ROWS, validate_product, import_products
+from database.isbn import normalize_isbn
 
 
 
 ''' Settings '''
 __all__ = ["member_api"]
 member_api = Blueprint("member_api", __name__)
+STREAM_HEARTBEAT = 15   # Seconds between keep-alive comments
+STREAM_DURATION  = 300  # Seconds before the client is asked to reconnect
 
 
 
@@ -26,7 +35,7 @@ member_api = Blueprint("member_api", __name__)
 @rate_limit
 def my_information(**kwargs):
 
-    user = kwargs["user"].entity
+    user = kwargs["user"].profile
     try:
         def get_info():
             return HTTPResponse("Success.", data={
@@ -36,13 +45,11 @@ def my_information(**kwargs):
                 "phone"      : user.phone,
             })
 
-        @Request.json("display_name: str", "email: str", "phone: str")
+        @Request.json("display_name: str(1..30)", "email: str(1..50)", "phone: str(1..10)")
         def edit_info(display_name, email, phone):
-            if len(display_name) == 0 or len(display_name) > 30        : raise DataInvalidException("displayName")
-            if len(email) == 0 or len(email) > 50 or ('@' not in email): raise DataInvalidException("email")
-            if len(phone) == 0 or len(phone) > 10                      : raise DataInvalidException("phone")
+            if '@' not in email: raise DataInvalidException("email")
             int(phone)  # Check phone composed by pure numbers
-            user.edit_information(display_name, email, phone)
+            kwargs["user"].entity.edit_information(display_name, email, phone)
             return HTTPResponse("Success.")
 
         methods = { "GET": get_info, "PATCH": edit_info }
@@ -88,11 +95,19 @@ def change_password(old_password, new_password, **kwargs):
 @login_required
 @rate_limit
 def get_my_lists(**kwargs):
+
+    user = kwargs["user"].entity
     try:
-        return HTTPResponse("Success.", data={
-            "collection": kwargs["user"].entity.collection,
-            "history"   : kwargs["user"].entity.history,
-        })
+        pages = { "collection": user.collection, "history": user.history }
+        return HTTPResponse("Success.", data=__paginate_sections__(pages))
+
+    except CursorInvalidException:
+        flask_logger.warning(f"CursorInvalidException: User '{user.username}' ({user.display_name}) tried to fetch lists.")
+        return HTTPError("Cursor invalid.", 400)
+
+    except ValueError:
+        flask_logger.warning(f"ValueError: User '{user.username}' ({user.display_name}) tried to fetch lists.")
+        return HTTPError("Requested Value With Wrong Type.", 400)
 
     except Exception as ex:
         flask_logger.error(f"Unknown exception: {str(ex)}")
@@ -104,28 +119,44 @@ def get_my_lists(**kwargs):
 @rate_limit
 def get_my_products(**kwargs):
     
+    user = kwargs["user"].profile
     try:
-        user_id  = kwargs["user"].entity.user_id
-        products = ProductEntity.query.filter_by(seller_id=user_id).all()
-        sold_out_products = list(filter(lambda p:     p.sold_out, products))
-        not_sold_products = list(filter(lambda p: not p.sold_out, products))
-        for_sale_products = list(filter(lambda p:     p.for_sale, not_sold_products))
-        editing_products  = list(filter(lambda p: not p.for_sale, not_sold_products))
-        for_sale_products = sorted(for_sale_products, key=lambda p: p.update_time, reverse=True)
-        editing_products  = sorted(editing_products , key=lambda p: p.update_time, reverse=True)
-        sold_out_products = sorted(sold_out_products, key=lambda p: p.update_time, reverse=True)
+        pages = {
+            f"{status}Products": partial(ProductEntity.seller_page, user.user_id, status)
+            for status in [ "forSale", "editing", "soldOut" ]
+        }
+        return HTTPResponse("Success.", data=__paginate_sections__(pages))
 
-        return HTTPResponse("Success.", data={
-            "forSaleProducts": [ p.overview_json for p in for_sale_products ],
-            "editingProducts": [ p.overview_json for p in editing_products  ],
-            "soldOutProducts": [ p.overview_json for p in sold_out_products ],
-        })
+    except CursorInvalidException:
+        flask_logger.warning(f"CursorInvalidException: User '{user.username}' ({user.display_name}) tried to fetch products.")
+        return HTTPError("Cursor invalid.", 400)
+
+    except ValueError:
+        flask_logger.warning(f"ValueError: User '{user.username}' ({user.display_name}) tried to fetch products.")
+        return HTTPError("Requested Value With Wrong Type.", 400)
 
     except Exception as ex:
         flask_logger.error(f"Unknown exception: {str(ex)}")
         return HTTPError(str(ex), 404)
 
 
+def __paginate_sections__(pages):
+    # Without a cursor, returns the first page of every section.
+    # A cursor names its own section, so following it returns only that section.
+    limit  = page_limit(request.args.get("limit"))
+    cursor = request.args.get("cursor")
+    if cursor is not None:
+        section, *after = decode_cursor(cursor, str, datetime, int)
+        if section not in pages: raise CursorInvalidException
+        pages = { section: partial(pages[section], after=tuple(after)) }
+    data, next_cursors = {}, {}
+    for section, page in pages.items():
+        data[section], last = page(limit)
+        next_cursors[section] = encode_cursor(section, *last) if last is not None else None
+    data["nextCursors"] = next_cursors
+    return data
+
+
 def __product_access_check__(product, user_id):
     # Check product exist
     if product is None:
@@ -143,7 +174,7 @@ def __product_access_check__(product, user_id):
 @Request.json("product_id: int")
 def launch_product(product_id, **kwargs):
     
-    user = kwargs["user"].entity
+    user = kwargs["user"].profile
     try:
         product = ProductEntity.query.filter_by(product_id=product_id).first()
         __product_access_check__(product, user.user_id)
@@ -175,7 +206,7 @@ def launch_product(product_id, **kwargs):
 @Request.json("product_id: int")
 def discontinue_product(product_id, **kwargs):
     
-    user = kwargs["user"].entity
+    user = kwargs["user"].profile
     try:
         product = ProductEntity.query.filter_by(product_id=product_id).first()
         __product_access_check__(product, user.user_id)
@@ -211,7 +242,7 @@ def discontinue_product(product_id, **kwargs):
 @Request.json("product_id: int")
 def out_of_stock_product(product_id, **kwargs):
     
-    user = kwargs["user"].entity
+    user = kwargs["user"].profile
     try:
         product = ProductEntity.query.filter_by(product_id=product_id).first()
         __product_access_check__(product, user.user_id)
@@ -245,7 +276,7 @@ def out_of_stock_product(product_id, **kwargs):
 @rate_limit
 def edit_product(**kwargs):
 
-    user = kwargs["user"].entity
+    user = kwargs["user"].profile
 
     def get_info(user):
         try:
@@ -274,18 +305,13 @@ def edit_product(**kwargs):
             flask_logger.error(f"Unknown exception: {str(ex)}")
             return HTTPError(str(ex), 404)
 
-    @Request.json("product_id: int", "ISBN: str", "name: str", "price: int", "images: list",
-                  "condition: int", "noted: bool", "location: str", "language: str", "extra_description: str")
+    @Request.json("product_id: int", PRODUCT_SCHEMA)
     def update_info(user, product_id, ISBN, name, price, images,
                     condition, noted, location, language, extra_description):
         try:
 
-            if len(ISBN) > 13               : raise DataInvalidException("ISBN")
-            if len(name) > 30               : raise DataInvalidException("Name")
-            if len(images) > 10             : raise DataInvalidException("Images")
-            if len(location) > 30           : raise DataInvalidException("Location")
-            if len(language) > 10           : raise DataInvalidException("Language")
-            if len(extra_description) > 1000: raise DataInvalidException("Extra description")
+            if normalize_isbn(ISBN) is None: raise DataInvalidException("ISBN")
+            if len(name) > 30              : raise DataInvalidException("Name")
 
             product = ProductEntity.query.filter_by(product_id=product_id).first()
             __product_access_check__(product, user.user_id)
@@ -320,21 +346,15 @@ def edit_product(**kwargs):
 @member_api.route("/products/new", methods=["POST"])
 @login_required
 @rate_limit
-@Request.json("ISBN: str", "name: str", "price: int", "images: list", "condition: int",
-              "noted: bool", "location: str", "language: str", "extra_description: str")
+@Request.json(PRODUCT_SCHEMA)
 def new_product(ISBN, name, price, images, condition, noted,
                 location, language, extra_description, **kwargs):
     
-    user = kwargs["user"].entity
+    user = kwargs["user"].profile
     try:
         seller_id = user.user_id
-        name = name.strip()
-        if len(ISBN) != 10 and len(ISBN) != 13: raise DataInvalidException("ISBN")
-        if len(name) == 0 or len(name) > 30   : raise DataInvalidException("Name")
-        if len(images) > 10                   : raise DataInvalidException("Images")
-        if len(location) > 30                 : raise DataInvalidException("Location")
-        if len(language) > 10                 : raise DataInvalidException("Language")
-        if len(extra_description) > 1000      : raise DataInvalidException("Extra description")
+        ISBN, name, price, images, condition, noted, location, language, extra_description = \
+            validate_product(ISBN, name, price, images, condition, noted, location, language, extra_description)
         ProductEntity(ISBN, seller_id, name, price, images, condition,
                       noted, location, language, extra_description).register()
         return HTTPResponse("Success.")
@@ -348,31 +368,48 @@ def new_product(ISBN, name, price, images, condition, noted,
         return HTTPError(str(ex), 404)
 
 
+@member_api.route("/products/import", methods=["POST"])
+@login_required
+@rate_limit
+@Request.json(f"products: list(1..{IMPORT_MAX_ROWS})", messages={"products": "Products invalid."})
+def import_new_products(products, **kwargs):
+
+    user = kwargs["user"].profile
+    try:
+        # Every row has the fields of /products/new; valid rows are imported even if others are rejected
+        imported, errors = import_products(user.user_id, products)
+        flask_logger.info(f"User '{user.username}' ({user.display_name}) imported {imported} product(s), {len(errors)} row(s) rejected.")
+        return HTTPResponse("Success.", data={"imported": imported, "errors": errors})
+
+    except Exception as ex:
+        flask_logger.error(f"Unknown exception: {str(ex)}")
+        return HTTPError(str(ex), 404)
+
+
 @member_api.route("/notifications", methods=["GET"])
 @login_required
 @rate_limit
 def fetch_notifications(**kwargs):
     
-    user = kwargs["user"].entity
+    user = kwargs["user"].profile
     try:
-        notifications = NotificationEntity.query.filter_by(user_id=user.user_id).all()
-
+        now = datetime.now()
         timestamp = request.args.get("timestamp")
-        if timestamp is not None:
-            timestamp = int(timestamp)
-            notifications = list(filter(lambda n: n.create_time.timestamp() > timestamp, notifications))
+        after_id  = request.args.get("afterId")
+        since     = datetime.fromtimestamp(int(timestamp)) if timestamp is not None else None
+        after_id  = int(after_id) if after_id is not None else None
 
-        notifications.reverse()
+        # Filtered in SQL, so a poll that finds nothing new is one indexed query
+        notifications = NotificationEntity.fetch(user.user_id, since, after_id)
         notification_jsons = [ n.json for n in notifications ]
 
-        notifications = NotificationEntity.query.filter_by(user_id=user.user_id).all()
         read = request.args.get("read")
-        if read == "true":
-            for notification in notifications: notification.update_read()
+        if read == "true": NotificationEntity.read_all(user.user_id)
         
         return HTTPResponse("Success.", data={
             "notifications": notification_jsons,
-            "timestamp"    : str(int(datetime.now().timestamp())),
+            "timestamp"    : str(int(now.timestamp())),
+            "lastId"       : notifications[0].notification_id if len(notifications) > 0 else after_id,
         })
 
     except ValueError:
@@ -381,4 +418,62 @@ def fetch_notifications(**kwargs):
 
     except Exception as ex:
         flask_logger.error(f"Unknown exception: {str(ex)} (IP '{kwargs['remote_addr']}')")
-        return HTTPError(str(ex), 404)
\ No newline at end of file
+        return HTTPError(str(ex), 404)
+
+
+@member_api.route("/notifications/unread", methods=["GET"])
+@login_required
+@rate_limit
+def count_unread_notifications(**kwargs):
+
+    user = kwargs["user"].profile
+    try:
+        return HTTPResponse("Success.", data={ "unread": NotificationEntity.unread_count(user.user_id) })
+
+    except Exception as ex:
+        flask_logger.error(f"Unknown exception: {str(ex)} (IP '{kwargs['remote_addr']}')")
+        return HTTPError(str(ex), 404)
+
+
+@member_api.route("/notifications/stream", methods=["GET"])
+@login_required
+@rate_limit
+def stream_notifications(**kwargs):
+    
+    user = kwargs["user"].profile
+    try:
+        # Resume after the last id the client has seen, replaying what it missed while disconnected
+        last_id = request.headers.get("Last-Event-ID", request.args.get("afterId"))
+        last_id = int(last_id) if last_id is not None else None
+        subscriber = notification_hub.subscribe(user.user_id, last_id)
+        missed = NotificationEntity.fetch(user.user_id, after_id=last_id) if last_id is not None else []
+
+        def event(message):
+            return f"id: {message['notificationId']}\nevent: notification\ndata: {json.dumps(message, ensure_ascii=False)}\n\n"
+
+        def stream():
+            try:
+                yield f"retry: {STREAM_HEARTBEAT * 1000}\n\n"
+                for notification in reversed(missed):
+                    # Skipped when it was also delivered live since subscribing, and queued already
+                    if subscriber.claim(notification.notification_id):
+                        yield event(notification_message(notification))
+                deadline = datetime.now().timestamp() + STREAM_DURATION
+                while datetime.now().timestamp() < deadline:
+                    try:
+                        yield event(subscriber.queue.get(timeout=STREAM_HEARTBEAT))
+                    except queue.Empty:
+                        yield ": keep-alive\n\n"
+            finally:
+                notification_hub.unsubscribe(subscriber)
+
+        return Response(stream(), mimetype="text/event-stream",
+                        headers={ "Cache-Control": "no-cache", "X-Accel-Buffering": "no" })
+
+    except ValueError:
+        flask_logger.warning(f"ValueError: User '{user.username}' ({user.display_name}) tried to stream notifications.")
+        return HTTPError("The parameter afterId invalid.", 403)
+
+    except Exception as ex:
+        flask_logger.error(f"Unknown exception: {str(ex)} (IP '{kwargs['remote_addr']}')")
+        return HTTPError(str(ex), 404)
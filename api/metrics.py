@@ -0,0 +1,34 @@
+''' Libraries '''
+import logging
+flask_logger = logging.getLogger(name="flask")
+from flask import Blueprint
+
+from api.auth import login_required
+from api.utils.rate_limit import rate_limit
+from api.utils.response import *
+from utils.metrics import collect_metrics
+
+
+
+''' Settings '''
+__all__ = ["metrics_api"]
+metrics_api = Blueprint("metrics_api", __name__)
+
+
+
+''' Functions '''
+@metrics_api.route("/", methods=["GET"])
+@login_required
+@rate_limit
+def get_metrics(**kwargs):
+
+    user = kwargs["user"].profile
+    try:
+        if user.role != "Admin":
+            flask_logger.warning(f"PermissionDenied: User '{user.username}' ({user.display_name}) tried to read metrics.")
+            return HTTPError("Permission denied.", 403)
+        return HTTPResponse("Success.", data=collect_metrics())
+
+    except Exception as ex:
+        flask_logger.error(f"Unknown exception: {str(ex)}")
+        return HTTPError(str(ex), 404)
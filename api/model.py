@@ -7,6 +7,9 @@ my_selenium_logger = logging.getLogger(name="selenium-wire")
 from datetime import datetime, timedelta
 
 from database.model import AccountEntity
+from database.events import subscribe
+from utils.cache import TTLCache
+from utils.metrics import register_metrics
 from utils.exceptions import UsernameRepeatedException, \
     UsernameNotExistException, PasswordWrongException
 
@@ -16,12 +19,36 @@ from utils.exceptions import UsernameRepeatedException, \
 JWT_SECRET  = os.environ.get("JWT_SECRET")
 JWT_ISSUER  = os.environ.get("JWT_ISSUER")
 JWT_EXPIRE  = timedelta(days=int(os.environ.get("JWT_EXPIRE")))
+ACCOUNT_CACHE_SIZE = int(os.environ.get("ACCOUNT_CACHE_SIZE", 4096))
+ACCOUNT_CACHE_TTL  = int(os.environ.get("ACCOUNT_CACHE_TTL", 60))
+
+
+
+''' Settings '''
+# username -> AccountProfile, dropped whenever the account is edited
+account_cache = TTLCache(maxsize=ACCOUNT_CACHE_SIZE, ttl=ACCOUNT_CACHE_TTL)
+register_metrics("accountCache", lambda: account_cache.stats)
+
+
+@subscribe("account_changed")
+def _on_account_changed(account):
+    account_cache.pop(account.username)
 
 
 
 ''' Models '''
+class AccountProfile():
+    # Read-only projection of AccountEntity used by request handlers, safe to share across requests
+    __slots__ = ["user_id", "username", "display_name", "email", "phone", "role"]
+
+    def __init__(self, entity):
+        for field in self.__slots__:
+            setattr(self, field, getattr(entity, field))
+
+
 class Account():
     def __init__(self):
+        self._entity = None
         return
 
     def register(self, username, password, display_name, email, phone):
@@ -43,9 +70,23 @@ class Account():
 
     def access(self, username):
         self.username = username
-        self.entity = AccountEntity.query.filter_by(username=self.username)
-        if self.entity.first() is None: raise UsernameNotExistException
-        self.entity = self.entity.first()
+        self.profile = account_cache.get(username)
+        if self.profile is None:
+            self.entity = AccountEntity.query.filter_by(username=self.username).first()
+            if self.entity is None: raise UsernameNotExistException
+            self.profile = AccountProfile(self.entity)
+            account_cache.set(username, self.profile)
+
+    @property
+    def entity(self):
+        # Loaded on demand, handlers that only read the account use `profile`
+        if self._entity is None:
+            self._entity = AccountEntity.query.filter_by(username=self.username).first()
+        return self._entity
+
+    @entity.setter
+    def entity(self, entity):
+        self._entity = entity
 
     @property
     def jwt(self):
@@ -1,5 +1,6 @@
 ''' Libraries '''
 import logging
+from datetime import datetime
 flask_logger = logging.getLogger(name="flask")
 from flask import Blueprint, request
 
@@ -7,8 +8,16 @@ from utils.exceptions import *
 from api.utils.request import Request
 from api.utils.response import *
 from api.utils.rate_limit import rate_limit
+from api.utils.pagination import encode_cursor, decode_cursor, page_limit
+from api.utils.response_cache import response_cache
 from api.auth import login_detect, login_required
-from database.model import ProductEntity, NotificationEntity, SeenRelationship, LikesRelationship
+from database.model import ProductEntity, NotificationEntity, LikesRelationship
+from database.search import search_index, rank_key
+from database.leaderboard import leaderboard
+from database.isbn import normalize_isbn, find_book_id
+from database.book_stats import book_stats
+from database.view_buffer import view_buffer
+from database.loader import ProductLoader
 
 
 
@@ -19,16 +28,37 @@ product_api = Blueprint("product_api", __name__)
 
 
 ''' Functions '''
+def __product_tags__(products):
+    # Response cache tags of the products listed in a response
+    return [ f"product:{p['productId']}" for p in products ]
+
+
+def __browse_filters__(args):
+    # Query string of /product/browse -> filters of ProductEntity.browse, raises ValueError on wrong types
+    def integer(name): return int(args[name]) if args.get(name) is not None else None
+    noted = args.get("noted")
+    if noted not in (None, "true", "false"): raise ValueError("noted")
+    conditions = args.get("condition")
+    return {
+        "min_price" : integer("minPrice"),
+        "max_price" : integer("maxPrice"),
+        "conditions": [ int(c) for c in conditions.split(',') ] if conditions is not None else None,
+        "noted"     : None if noted is None else noted == "true",
+        "language"  : args.get("language"),
+        "location"  : args.get("location"),
+    }
+
+
 @product_api.route("/", methods=["GET"])
 @rate_limit(ip_based=True)
+@response_cache.cached(key=lambda **kwargs: (),
+                       tags=lambda data: [ "catalogue", "ranking" ] + __product_tags__(data["products"]))
 def get_top10_products(**kwargs):
 
     try:
-        products = ProductEntity.query.all()
-        products = list(filter(lambda p: not p.sold_out, products))
-        products = list(filter(lambda p: p.for_sale, products))
-        products = sorted(products, key=lambda p: p.likes, reverse=True)
-        products = [ p.overview_json for p in products[:10] ]
+        ranking  = leaderboard.top(10)
+        products = ProductEntity.get_many([ pid for pid, _ in ranking ])
+        products = ProductLoader(products, likes=dict(ranking)).overview_jsons()
         return HTTPResponse("Success.", data={"products": products})
 
     except Exception as ex:
@@ -38,47 +68,31 @@ def get_top10_products(**kwargs):
 
 @product_api.route("/search", methods=["POST"])
 @rate_limit(ip_based=True)
-@Request.json("keywords: str")
-def search_products(keywords, **kwargs):
+@Request.json("keywords: str", "cursor", "limit")
+@response_cache.cached(key=lambda keywords, cursor, limit, **kwargs: (tuple(sorted(keywords.split(' '))), cursor, limit),
+                       tags=lambda data: [ "catalogue", "ranking" ] + __product_tags__(data["products"]))
+def search_products(keywords, cursor, limit, **kwargs):
 
     try:
+        limit = page_limit(limit)
         keywords = keywords.split(' ')
-        products = ProductEntity.query.all()
-        products_not_sold_out = list(filter(lambda p: not p.sold_out, products))
-        products_not_sold_out = list(filter(lambda p:     p.for_sale, products_not_sold_out))
-        products_is_sold_out  = list(filter(lambda p:     p.sold_out, products))
-        products_not_sold_out = list(filter(
-            lambda p: sum([ kw in p.name                for kw in keywords ]) or
-                      sum([ kw in p.extra_desc          for kw in keywords ]) or 
-                      sum([ kw in p.seller.display_name for kw in keywords ]),
-            products_not_sold_out
-        ))
-        products_not_sold_out = sorted(products_not_sold_out,
-            key=lambda p: sum([
-                sum([ kw in p.name                for kw in keywords ]) * 100000,
-                sum([ kw in p.extra_desc          for kw in keywords ]) * 1000,
-                sum([ kw in p.seller.display_name for kw in keywords ]) * 100,
-                p.likes * 10,
-                p.views,
-            ]),
-            reverse=True
-        )
-        products_is_sold_out = list(filter(
-            lambda p: sum([ kw in p.name for kw in keywords ]) or sum([ kw in p.extra_desc for kw in keywords ]),
-            products_is_sold_out
-        ))
-        products_is_sold_out = sorted(products_is_sold_out,
-            key=lambda p: sum([
-                sum([ kw in p.name       for kw in keywords ]) * 100000,
-                sum([ kw in p.extra_desc for kw in keywords ]) * 1000,
-                p.likes * 10,
-                p.views,
-            ]),
-            reverse=True
-        )
-        products = products_not_sold_out + products_is_sold_out
-        products = [ p.overview_json for p in products ]
-        return HTTPResponse("Success.", data={"products": products})
+        results = search_index.search(keywords)
+        if cursor is not None:
+            after = tuple(decode_cursor(cursor, int, (int, float), int))
+            results = [ r for r in results if rank_key(r) > after ]
+        page, has_more = results[:limit], len(results) > limit
+        products = ProductEntity.get_many([ pid for pid, _, _ in page ])
+        products = ProductLoader(products).overview_jsons()
+        next_cursor = encode_cursor(*rank_key(page[-1])) if has_more else None
+        return HTTPResponse("Success.", data={"products": products, "nextCursor": next_cursor})
+
+    except CursorInvalidException:
+        flask_logger.warning(f"CursorInvalidException: IP '{kwargs['remote_addr']}' tried to search products")
+        return HTTPError("Cursor invalid.", 400)
+
+    except ValueError:
+        flask_logger.warning(f"ValueError: IP '{kwargs['remote_addr']}' tried to search products")
+        return HTTPError("Requested Value With Wrong Type.", 400)
 
     except Exception as ex:
         flask_logger.error(f"Unknown exception: {str(ex)} (IP '{kwargs['remote_addr']}')")
@@ -88,6 +102,8 @@ def search_products(keywords, **kwargs):
 @product_api.route("/view", methods=["GET"])
 @rate_limit(ip_based=True)
 @login_detect
+@response_cache.cached(key=lambda **kwargs: None if "user" in kwargs else request.args.get("productId"),
+                       tags=lambda data: __product_tags__([ data["details"] ]))
 def get_product_detail(**kwargs):
 
     try:
@@ -95,14 +111,9 @@ def get_product_detail(**kwargs):
         product = ProductEntity.query.filter_by(product_id=product_id).first()
         if product is None: raise ProductIdNotExistsException
 
-        # Create or update seen relationship if is logged in
+        # Record the view in the history if is logged in, written behind by the view buffer
         if "user" in kwargs:
-            user_id = kwargs["user"].entity.user_id
-            seen = SeenRelationship.query.filter_by(user_id=user_id, product_id=product_id).first()
-            if seen is None:
-                SeenRelationship(user_id, product_id).register()
-                seen = SeenRelationship.query.filter_by(user_id=user_id, product_id=product_id).first()
-            seen.update_time()
+            view_buffer.record(kwargs["user"].profile.user_id, product_id)
 
         return HTTPResponse("Success.", data={"details": product.detail_json})
 
@@ -119,6 +130,77 @@ def get_product_detail(**kwargs):
         return HTTPError(str(ex), 404)
 
 
+@product_api.route("/book", methods=["GET"])
+@rate_limit(ip_based=True)
+def get_book_listings(**kwargs):
+
+    try:
+        ISBN = normalize_isbn(request.args.get("ISBN") or "")
+        if ISBN is None: raise DataInvalidException("ISBN")
+        limit  = page_limit(request.args.get("limit"))
+        cursor = request.args.get("cursor")
+        after  = tuple(decode_cursor(cursor, int, int)) if cursor is not None else None
+
+        # An ISBN nobody has listed yet is a book without copies, not an error
+        book_id = find_book_id(ISBN)
+        if book_id is None:
+            stats, products, last = book_stats(None), [], None
+        else:
+            stats = book_stats(book_id)
+            products, last = ProductEntity.book_page(book_id, limit, after)
+            products = ProductLoader(products).overview_jsons()
+        next_cursor = encode_cursor(*last) if last is not None else None
+        return HTTPResponse("Success.", data={"ISBN": ISBN, "stats": stats, "products": products, "nextCursor": next_cursor})
+
+    except DataInvalidException as ex:
+        flask_logger.warning(f"DataInvalidException: IP '{kwargs['remote_addr']}' tried to browse book '{request.args.get('ISBN')}'")
+        return HTTPError(f"{ex} invalid.", 403)
+
+    except CursorInvalidException:
+        flask_logger.warning(f"CursorInvalidException: IP '{kwargs['remote_addr']}' tried to browse book '{request.args.get('ISBN')}'")
+        return HTTPError("Cursor invalid.", 400)
+
+    except ValueError:
+        flask_logger.warning(f"ValueError: IP '{kwargs['remote_addr']}' tried to browse book '{request.args.get('ISBN')}'")
+        return HTTPError("Requested Value With Wrong Type.", 400)
+
+    except Exception as ex:
+        flask_logger.error(f"Unknown exception: {str(ex)} (IP '{kwargs['remote_addr']}')")
+        return HTTPError(str(ex), 404)
+
+
+@product_api.route("/browse", methods=["GET"])
+@rate_limit(ip_based=True)
+@response_cache.cached(key=lambda **kwargs: tuple(sorted(request.args.items())),
+                       tags=lambda data: [ "catalogue", "ranking" ] + __product_tags__(data["products"]))
+def browse_products(**kwargs):
+
+    try:
+        filters = __browse_filters__(request.args)
+        sort    = request.args.get("sort", "recent")
+        if sort not in ("price", "priceDesc", "recent", "likes"): raise ValueError("sort")
+        limit  = page_limit(request.args.get("limit"))
+        cursor = request.args.get("cursor")
+        after  = tuple(decode_cursor(cursor, datetime if sort == "recent" else int, int)) if cursor is not None else None
+
+        products, last = ProductEntity.browse(filters, sort, limit, after)
+        products = ProductLoader(products).overview_jsons()
+        next_cursor = encode_cursor(*last) if last is not None else None
+        return HTTPResponse("Success.", data={"products": products, "nextCursor": next_cursor})
+
+    except CursorInvalidException:
+        flask_logger.warning(f"CursorInvalidException: IP '{kwargs['remote_addr']}' tried to browse products")
+        return HTTPError("Cursor invalid.", 400)
+
+    except ValueError:
+        flask_logger.warning(f"ValueError: IP '{kwargs['remote_addr']}' tried to browse products")
+        return HTTPError("Requested Value With Wrong Type.", 400)
+
+    except Exception as ex:
+        flask_logger.error(f"Unknown exception: {str(ex)} (IP '{kwargs['remote_addr']}')")
+        return HTTPError(str(ex), 404)
+
+
 @product_api.route("/like", methods=["POST", "DELETE"])
 @login_required
 @rate_limit
@@ -126,7 +208,7 @@ def get_product_detail(**kwargs):
 def like_or_unlike_product(product_id, **kwargs):
 
     try:
-        user = kwargs["user"].entity
+        user = kwargs["user"].profile
         product = ProductEntity.query.filter_by(product_id=product_id).first()
         if product is None: raise ProductIdNotExistsException
 
@@ -169,7 +251,7 @@ def like_or_unlike_product(product_id, **kwargs):
 @Request.json("product_id: int")
 def order_product(product_id, **kwargs):
     
-    user = kwargs["user"].entity
+    user = kwargs["user"].profile
     try:
         # Check product exist
         product = ProductEntity.query.filter_by(product_id=product_id).first()
@@ -181,8 +263,9 @@ def order_product(product_id, **kwargs):
 
         notification_for_seller = f"用戶 '{user.display_name}' 下訂了您的商品 '{product.name}'，" + \
                                   f"他的 Email 為: {user.email} / 電話為: {user.phone}。"
-        notification_for_buyer  = f"您下訂了商品 '{product.name}'，賣家 '{product.seller.display_name}' 的 " + \
-                                  f"Email 為: {product.seller.email} / 電話為: {product.seller.phone}。"
+        seller = product.seller
+        notification_for_buyer  = f"您下訂了商品 '{product.name}'，賣家 '{seller.display_name}' 的 " + \
+                                  f"Email 為: {seller.email} / 電話為: {seller.phone}。"
 
         NotificationEntity(product.seller_id, notification_for_seller).register()
         NotificationEntity(user.user_id, notification_for_buyer).register()
@@ -204,8 +287,9 @@ def order_product(product_id, **kwargs):
 @Request.json("product_id: int", "content: str")
 def leave_comment(product_id, content, **kwargs):
     
-    user = kwargs["user"].entity
+    user = kwargs["user"].profile
     try:
+        # The limit applies to the stripped content, as for product names in validate_product
         content = content.strip()
         if len(content) == 0 or len(content) > 100: raise DataInvalidException
         # Check product exist
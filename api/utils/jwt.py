@@ -1,12 +1,25 @@
 ''' Libraries '''
 import os
 import jwt
+import time
+
+from utils.cache import TTLCache
+from utils.metrics import register_metrics
 
 
 
 ''' Parameters '''
 JWT_SECRET = os.environ.get("JWT_SECRET")
 JWT_ISSUER = os.environ.get("JWT_ISSUER")
+JWT_CACHE_SIZE = int(os.environ.get("JWT_CACHE_SIZE", 4096))
+JWT_CACHE_TTL  = int(os.environ.get("JWT_CACHE_TTL", 300))
+
+
+
+''' Settings '''
+# Decoded tokens signed with our own secret; an entry never outlives the token's "exp"
+token_cache = TTLCache(maxsize=JWT_CACHE_SIZE, ttl=JWT_CACHE_TTL)
+register_metrics("jwtCache", lambda: token_cache.stats)
 
 
 
@@ -15,6 +28,9 @@ def jwt_decode(token, jwt_secret=None, audience=None, jwt_issuer=None):
     if jwt_secret is not None:
         assert audience   is not None
         assert jwt_issuer is not None
+    else:
+        json = token_cache.get(token)
+        if json is not None: return json
     try:
         if jwt_secret is not None:
             json = jwt.decode(token, jwt_secret,
@@ -25,6 +41,8 @@ def jwt_decode(token, jwt_secret=None, audience=None, jwt_issuer=None):
             json = jwt.decode(token, JWT_SECRET,
                               issuer=JWT_ISSUER,
                               algorithms="HS256")
+            ttl = json["exp"] - time.time() if "exp" in json else JWT_CACHE_TTL
+            if ttl > 0: token_cache.set(token, json, ttl=min(ttl, JWT_CACHE_TTL))
     except jwt.exceptions.PyJWTError:
         return None
-    return json
\ No newline at end of file
+    return json
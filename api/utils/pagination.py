@@ -0,0 +1,43 @@
+''' Libraries '''
+import json
+import base64
+from datetime import datetime
+
+from utils.exceptions import CursorInvalidException
+
+
+
+''' Settings '''
+__all__ = ["encode_cursor", "decode_cursor", "page_limit"]
+DEFAULT_LIMIT = 20
+MAX_LIMIT     = 100
+
+
+
+''' Functions '''
+def encode_cursor(*values):
+    # Opaque for clients: base64 of the sort key of the last item on the page
+    values = [ {"dt": v.isoformat()} if isinstance(v, datetime) else v for v in values ]
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode()
+
+
+def decode_cursor(cursor, *shape):
+    # Raises CursorInvalidException on anything that was not produced by encode_cursor with one value
+    # per entry of `shape`, each of that type (or one of those types), e.g. decode_cursor(c, datetime, int)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        assert type(values) is list
+        values = [ datetime.fromisoformat(v["dt"]) if type(v) is dict else v for v in values ]
+    except Exception:
+        raise CursorInvalidException
+    if len(values) != len(shape): raise CursorInvalidException
+    for value, types in zip(values, shape):
+        if type(value) not in (types if type(types) is tuple else (types,)): raise CursorInvalidException
+    return values
+
+
+def page_limit(limit):
+    if limit is None: return DEFAULT_LIMIT
+    limit = int(limit)
+    if limit < 1: raise ValueError("Limit invalid.")
+    return min(limit, MAX_LIMIT)
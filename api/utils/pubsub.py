@@ -0,0 +1,189 @@
+''' Libraries '''
+import os
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from werkzeug.http import http_date
+
+from database.events import subscribe
+from database.model import NotificationEntity
+from utils.metrics import register_metrics
+
+
+
+''' Parameters '''
+NOTIFICATION_FANOUT        = os.environ.get("NOTIFICATION_FANOUT", "local")  # "local" or "database"
+NOTIFICATION_POLL_INTERVAL = float(os.environ.get("NOTIFICATION_POLL_INTERVAL", 1.0))
+NOTIFICATION_POLL_LAG      = int(os.environ.get("NOTIFICATION_POLL_LAG", 100))  # Ids below the newest one re-scanned by every poll
+SUBSCRIBER_QUEUE_SIZE      = 100
+RECENT_IDS_SIZE            = 1000  # Delivered ids remembered per subscriber (and per poller) to drop duplicates
+
+
+
+''' Settings '''
+__all__ = ["notification_message", "NotificationHub", "LocalFanout", "DatabaseFanout", "notification_hub"]
+
+
+
+''' Functions '''
+def notification_message(notification):
+    return {
+        "notificationId": notification.notification_id,
+        "read"          : notification.read,
+        "content"       : notification.content,
+        "createTime"    : http_date(notification.create_time),
+    }
+
+
+class _RecentIds():
+    # Bounded set of the last `size` ids added, oldest evicted first
+    def __init__(self, size=RECENT_IDS_SIZE):
+        self.order = deque()
+        self.ids   = set()
+        self.size  = size
+
+    def add(self, notification_id):
+        # True when the id was not seen yet
+        if notification_id in self.ids: return False
+        self.ids.add(notification_id)
+        self.order.append(notification_id)
+        if len(self.order) > self.size: self.ids.discard(self.order.popleft())
+        return True
+
+
+class _Subscriber():
+    # `after_id` is where the client resumed, what it has seen before; the rest is deduplicated
+    # by id, since notifications are not committed in id order and may reach it more than once.
+    def __init__(self, user_id, after_id):
+        self.user_id  = user_id
+        self.after_id = after_id or 0
+        self.lock     = threading.Lock()
+        self.seen     = _RecentIds()
+        self.queue    = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def claim(self, notification_id):
+        # True exactly once per notification, for whichever of the backfill or a delivery comes first
+        if notification_id <= self.after_id: return False
+        with self.lock:
+            return self.seen.add(notification_id)
+
+
+class NotificationHub():
+    # In-process pub/sub keyed by user_id. Messages reach the hub through a fan-out backend,
+    # which decides how notifications written by other workers are discovered.
+
+    def __init__(self, fanout):
+        self.lock        = threading.Lock()
+        self.subscribers = {}  # user_id -> set of _Subscriber
+        self.dropped     = 0
+        self.fanout      = fanout
+
+    def init_app(self, app):
+        self.fanout.start(self, app)
+
+    def subscribe(self, user_id, after_id=None):
+        subscriber = _Subscriber(user_id, after_id)
+        with self.lock:
+            self.subscribers.setdefault(user_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            subscribers = self.subscribers.get(subscriber.user_id, set())
+            subscribers.discard(subscriber)
+            if len(subscribers) == 0: self.subscribers.pop(subscriber.user_id, None)
+
+    def deliver(self, user_id, message):
+        # Messages are deduplicated per subscriber by the ids it recently got,
+        # so a backend may deliver the same notification more than once.
+        with self.lock:
+            for subscriber in self.subscribers.get(user_id, []):
+                if not subscriber.claim(message["notificationId"]): continue
+                try:
+                    subscriber.queue.put_nowait(message)
+                except queue.Full:
+                    self.dropped += 1
+
+    def publish(self, notification):
+        self.fanout.publish(self, notification.user_id, notification_message(notification))
+
+    @property
+    def stats(self):
+        with self.lock:
+            return {
+                "users"      : len(self.subscribers),
+                "subscribers": sum(len(s) for s in self.subscribers.values()),
+                "dropped"    : self.dropped,
+                "fanout"     : type(self.fanout).__name__,
+            }
+
+
+class LocalFanout():
+    # Single process: a published notification is delivered directly
+    def start(self, hub, app):
+        pass
+
+    def publish(self, hub, user_id, message):
+        hub.deliver(user_id, message)
+
+
+class DatabaseFanout(LocalFanout):
+    # Several workers: each one also runs a single poller that fetches the recent notifications
+    # and hands them to its own subscribers, so the database sees one primary-key range query per
+    # worker per interval instead of one per polling client. Ids are allocated before commit, so a
+    # notification may become visible after a higher one: every poll re-scans the `lag` ids below
+    # the newest it has seen, and the ones already delivered are skipped.
+
+    def __init__(self, interval=NOTIFICATION_POLL_INTERVAL, lag=NOTIFICATION_POLL_LAG):
+        self.interval = interval
+        self.lag      = lag
+        self.last_id  = None
+        self.seen     = _RecentIds()
+        self.lock     = threading.Lock()
+        self.pid      = None  # Process the poller runs in
+
+    def start(self, hub, app):
+        self.hub = hub
+        self.app = app
+        app.before_request(self._start_poller)
+
+    def _start_poller(self):
+        # Started by the first request of each process, so that every worker of a pre-fork server
+        # (gunicorn --preload) polls for its own subscribers
+        if self.pid == os.getpid(): return
+        with self.lock:
+            if self.pid == os.getpid(): return
+            self.pid = os.getpid()
+        threading.Thread(target=self._poll, name="notification-fanout", daemon=True).start()
+
+    def _poll(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                with self.app.app_context():
+                    self._poll_once()
+            except Exception as ex:
+                logging.error(f"Notification fan-out poll failed: {str(ex)}")
+
+    def _poll_once(self):
+        if self.last_id is None:
+            latest = NotificationEntity.query.order_by(NotificationEntity.notification_id.desc()).first()
+            self.last_id = latest.notification_id if latest is not None else 0
+            return
+        notifications = NotificationEntity.query.filter(NotificationEntity.notification_id > self.last_id - self.lag) \
+                                                .order_by(NotificationEntity.notification_id).all()
+        for notification in notifications:
+            self.last_id = max(self.last_id, notification.notification_id)
+            if not self.seen.add(notification.notification_id): continue
+            self.hub.deliver(notification.user_id, notification_message(notification))
+
+
+notification_hub = NotificationHub(DatabaseFanout() if NOTIFICATION_FANOUT == "database" else LocalFanout())
+register_metrics("notificationHub", lambda: notification_hub.stats)
+
+
+@subscribe("notification_created")
+def _on_notification_created(notification):
+    notification_hub.publish(notification)
@@ -1,9 +1,15 @@
 ''' Libraries '''
+import os
+import mmap
+import struct
+import hashlib
 import logging
 flask_logger = logging.getLogger(name="flask")
+import threading
 from flask import request
 from functools import wraps
 from datetime import datetime
+from collections import OrderedDict
 
 from api.utils.response import HTTPError
 from utils.exceptions import BannedException
@@ -11,7 +17,212 @@ from database.model import Connection
 
 
 
+''' Settings '''
+__all__ = ["rate_limit", "RateLimitBackend", "MemoryBackend", "SharedMemoryBackend", "set_backend", "check_shared_memory"]
+WINDOW   = 1.0   # Seconds
+IDLE_TTL = 60.0  # Seconds before an idle target is evicted from memory
+RATE_LIMIT_SHM_PATH  = os.environ.get("RATE_LIMIT_SHM_PATH")
+RATE_LIMIT_SHM_SLOTS = int(os.environ.get("RATE_LIMIT_SHM_SLOTS", 65536))
+RATE_LIMIT_SHM_RESET = os.environ.get("RATE_LIMIT_SHM_RESET", "false").lower() in ("1", "true", "yes")  # Empty the file whenever a process opens it
+
+
+
+''' Backends '''
+class RateLimitBackend():
+    # Per-target request counters and a mirror of the ban state stored in `Connection`.
+    # Timestamps are POSIX seconds; `accept_time` is None when the target is not banned.
+
+    def hit(self, target, now):
+        # Records one request and returns the number of requests within the last WINDOW
+        raise NotImplementedError
+
+    def get_ban(self, target):
+        # Returns (known, accept_time, banned_turn); unknown targets must be loaded from the DB
+        raise NotImplementedError
+
+    def set_ban(self, target, accept_time, banned_turn):
+        raise NotImplementedError
+
+
+class _Window():
+    __slots__ = ["start", "previous", "current", "loaded", "accept_time", "banned_turn", "last_seen"]
+
+    def __init__(self, now):
+        self.start, self.previous, self.current = now, 0, 0
+        self.loaded, self.accept_time, self.banned_turn = False, None, 0
+        self.last_seen = now
+
+
+class MemoryBackend(RateLimitBackend):
+    # Sliding-window counter: the previous fixed window's count weighted by its overlap
+    # with the last WINDOW seconds, plus the current window's count. O(1) per check.
+
+    def __init__(self, idle_ttl=IDLE_TTL):
+        self.lock     = threading.Lock()
+        self.idle_ttl = idle_ttl
+        self.windows  = OrderedDict()  # target -> _Window, least recently seen first
+
+    def _window(self, target, now):
+        window = self.windows.get(target)
+        if window is None:
+            window = self.windows[target] = _Window(now)
+        else:
+            self.windows.move_to_end(target)
+        window.last_seen = now
+        while now - next(iter(self.windows.values())).last_seen > self.idle_ttl:
+            self.windows.popitem(last=False)
+        return window
+
+    def hit(self, target, now):
+        with self.lock:
+            window = self._window(target, now)
+            elapsed = now - window.start
+            if elapsed >= 2 * WINDOW:
+                window.start, window.previous, window.current = now, 0, 0
+            elif elapsed >= WINDOW:
+                window.start, window.previous, window.current = window.start + WINDOW, window.current, 0
+            window.current += 1
+            weight = max(0.0, 1.0 - (now - window.start) / WINDOW)
+            return window.previous * weight + window.current
+
+    def get_ban(self, target):
+        with self.lock:
+            window = self.windows.get(target)
+            if window is None or not window.loaded: return False, None, 0
+            return True, window.accept_time, window.banned_turn
+
+    def set_ban(self, target, accept_time, banned_turn):
+        now = datetime.now().timestamp()
+        with self.lock:
+            window = self._window(target, now)
+            window.loaded, window.accept_time, window.banned_turn = True, accept_time, banned_turn
+            window.start, window.previous, window.current = now, 0, 0
+
+
+class SharedMemoryBackend(RateLimitBackend):
+    # The same sliding-window counter kept in fixed-size slots of a memory-mapped file, so every
+    # pre-fork worker on the host enforces one limit. Targets hash to a bucket of BUCKET slots;
+    # a bucket is guarded by an fcntl byte-range lock (across processes) and a thread lock (within one).
+    # The header names the layout: a file written by another layout, or any file when `reset` is set,
+    # is emptied on open. Bans are mirrored in `Connection`, an emptied slot only loses its window count.
+    SLOT    = struct.Struct("<QdIIdIId")  # key, start, previous, current, accept_time, banned_turn, loaded, last_seen
+    BUCKET  = 8
+    HEADER  = struct.Struct("<8sIIQ")     # magic, layout version, slots per bucket, buckets
+    MAGIC   = b"NTNURLSM"
+    VERSION = 1                           # Bump on any change of SLOT or of the slot semantics
+    HEADER_SIZE = 64                      # Buckets start after it
+
+    def __init__(self, path, slots=RATE_LIMIT_SHM_SLOTS, idle_ttl=IDLE_TTL, reset=RATE_LIMIT_SHM_RESET):
+        import fcntl
+        self.fcntl    = fcntl
+        self.idle_ttl = idle_ttl
+        self.buckets  = max(1, slots // self.BUCKET)
+        self.bucket_size = self.SLOT.size * self.BUCKET
+        size = self.HEADER_SIZE + self.buckets * self.bucket_size
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        # The whole file is locked while it is checked, so no other process reads a bucket being emptied
+        self.fcntl.lockf(self.fd, self.fcntl.LOCK_EX, 0, 0)
+        try:
+            if os.fstat(self.fd).st_size < size: os.ftruncate(self.fd, size)
+            self.memory = mmap.mmap(self.fd, size)
+            header = self.HEADER.pack(self.MAGIC, self.VERSION, self.BUCKET, self.buckets)
+            found  = bytes(self.memory[:self.HEADER.size])
+            if found != header or reset:
+                if found.strip(b"\0") and found != header:
+                    flask_logger.warning(f"Rate limit file '{path}' has another layout, reinitialising it.")
+                self.memory[self.HEADER_SIZE:size] = bytes(size - self.HEADER_SIZE)
+                self.memory[:self.HEADER.size] = header
+        finally:
+            self.fcntl.lockf(self.fd, self.fcntl.LOCK_UN, 0, 0)
+        self.locks = [ threading.Lock() for _ in range(64) ]
+
+    def _locate(self, target):
+        key = int.from_bytes(hashlib.blake2b(target.encode(), digest_size=8).digest(), "little") or 1
+        return key, self.HEADER_SIZE + (key % self.buckets) * self.bucket_size
+
+    def _update(self, target, now, function):
+        # Runs `function(slot) -> (slot, result)` on the target's slot while holding its bucket
+        key, offset = self._locate(target)
+        with self.locks[(offset // self.bucket_size) % len(self.locks)]:
+            self.fcntl.lockf(self.fd, self.fcntl.LOCK_EX, self.bucket_size, offset)
+            try:
+                slots = [ offset + i * self.SLOT.size for i in range(self.BUCKET) ]
+                values = [ self.SLOT.unpack_from(self.memory, o) for o in slots ]
+                index = next((i for i, v in enumerate(values) if v[0] == key), None)
+                if index is None:
+                    # Reuse an empty or idle slot, otherwise the least recently seen one
+                    index = min(range(self.BUCKET),
+                                key=lambda i: (values[i][0] != 0 and now - values[i][7] <= self.idle_ttl, values[i][7]))
+                    slot = [ key, now, 0, 0, 0.0, 0, 0, now ]
+                else:
+                    slot = list(values[index])
+                slot[7] = now
+                slot, result = function(slot)
+                self.SLOT.pack_into(self.memory, slots[index], *slot)
+                return result
+            finally:
+                self.fcntl.lockf(self.fd, self.fcntl.LOCK_UN, self.bucket_size, offset)
+
+    def hit(self, target, now):
+        def count(slot):
+            elapsed = now - slot[1]
+            if elapsed >= 2 * WINDOW:
+                slot[1], slot[2], slot[3] = now, 0, 0
+            elif elapsed >= WINDOW:
+                slot[1], slot[2], slot[3] = slot[1] + WINDOW, slot[3], 0
+            slot[3] += 1
+            weight = max(0.0, 1.0 - (now - slot[1]) / WINDOW)
+            return slot, slot[2] * weight + slot[3]
+        return self._update(target, now, count)
+
+    def get_ban(self, target):
+        def read(slot):
+            accept_time = slot[4] if slot[4] > 0 else None
+            return slot, (bool(slot[6]), accept_time, slot[5])
+        return self._update(target, datetime.now().timestamp(), read)
+
+    def set_ban(self, target, accept_time, banned_turn):
+        now = datetime.now().timestamp()
+        def write(slot):
+            slot[4], slot[5], slot[6] = accept_time or 0.0, banned_turn or 0, 1
+            slot[1], slot[2], slot[3] = now, 0, 0
+            return slot, None
+        return self._update(target, now, write)
+
+
+_backend = SharedMemoryBackend(RATE_LIMIT_SHM_PATH) if RATE_LIMIT_SHM_PATH else MemoryBackend()
+
+
+def set_backend(backend):
+    global _backend
+    _backend = backend
+
+
+
 ''' Functions '''
+def _hit_many(path, slots, target, now, hits):
+    backend = SharedMemoryBackend(path, slots, reset=False)
+    return [ int(backend.hit(target, now)) for _ in range(hits) ]
+
+
+def check_shared_memory(path, processes=8, hits=1000, slots=RATE_LIMIT_SHM_SLOTS):
+    # Forks `processes` workers on a SharedMemoryBackend at `path`, each hitting one target `hits` times within
+    # one window. Every increment must be seen by exactly one request: raises AssertionError when the counts
+    # returned are not 1..processes*hits, each once, or when the total read back differs.
+    import time
+    import multiprocessing
+    SharedMemoryBackend(path, slots, reset=True)
+    target, now, total = "check-shared-memory", time.time(), processes * hits
+    with multiprocessing.get_context("fork").Pool(processes) as pool:
+        counts = pool.starmap(_hit_many, [ (path, slots, target, now, hits) ] * processes)
+    returned = sorted(count for process in counts for count in process)
+    assert returned == list(range(1, total + 1)), \
+        f"{total - len(set(returned))} of {total} counts lost or duplicated across {processes} processes"
+    final = int(SharedMemoryBackend(path, slots, reset=False).hit(target, now)) - 1
+    assert final == total, f"total {final} after {total} hits across {processes} processes"
+    return total
+
+
 def rate_limit(original_function=None, ip_based=False, limit=None):
 
     if limit is None: limit = 60 if ip_based else 20
@@ -24,30 +235,42 @@ def rate_limit(original_function=None, ip_based=False, limit=None):
             try:
                 kwargs["remote_addr"] = request.remote_addr
                 if ip_based: target = kwargs["remote_addr"]
-                else       : target = kwargs["user"].entity.username
+                else       : target = kwargs["user"].username
 
                 target_type = ["username", "IP"][int(ip_based)]
-                conn = Connection.query.filter_by(target=target).first()
-                if conn is None:
-                    conn = Connection(target, target_type)
-                    conn.register()
-                else:
-                    now = datetime.now()
-                    if conn.accept_time is not None and conn.accept_time > now:
-                        flask_logger.warning(f"Connection from {target_type}: '{target}' is still under banning. " + \
-                                                f"(Banned turn: {conn.banned_turn})")
-                        raise BannedException("Still under banning.")
-                    elif conn.accept_time is not None:
-                        flask_logger.warning(f"Connection from {target_type}: '{target}' has been unbanned. " + \
-                                                f"(Banned turn: {conn.banned_turn})")
-                        conn.unban()
-                    else:
-                        conn.access()
-                        if len(conn.records) > limit:
-                            flask_logger.warning(f"DDoS suspicion detected from {target_type}: '{target}'. " + \
-                                                    f"(Banned turn: {conn.banned_turn} --> {conn.banned_turn+1})")
-                            conn.ban()
-                            raise BannedException("DDoS suspicion detected.")
+                now = datetime.now().timestamp()
+
+                # The DB is only read for targets the backend has not seen recently,
+                # and only written when a ban starts or ends.
+                known, accept_time, banned_turn = _backend.get_ban(target)
+                if not known:
+                    conn = Connection.query.filter_by(target=target).first()
+                    if conn is not None and conn.accept_time is not None:
+                        accept_time, banned_turn = conn.accept_time.timestamp(), conn.banned_turn
+                    elif conn is not None:
+                        banned_turn = conn.banned_turn
+                    _backend.set_ban(target, accept_time, banned_turn)
+
+                if accept_time is not None and accept_time > now:
+                    flask_logger.warning(f"Connection from {target_type}: '{target}' is still under banning. " + \
+                                            f"(Banned turn: {banned_turn})")
+                    raise BannedException("Still under banning.")
+                elif accept_time is not None:
+                    flask_logger.warning(f"Connection from {target_type}: '{target}' has been unbanned. " + \
+                                            f"(Banned turn: {banned_turn})")
+                    conn = Connection.query.filter_by(target=target).first()
+                    if conn is not None: conn.unban()
+                    _backend.set_ban(target, None, banned_turn)
+                elif _backend.hit(target, now) > limit:
+                    flask_logger.warning(f"DDoS suspicion detected from {target_type}: '{target}'. " + \
+                                            f"(Banned turn: {banned_turn} --> {banned_turn+1})")
+                    conn = Connection.query.filter_by(target=target).first()
+                    if conn is None:
+                        conn = Connection(target, target_type)
+                        conn.register()
+                    conn.ban()
+                    _backend.set_ban(target, conn.accept_time.timestamp(), conn.banned_turn)
+                    raise BannedException("DDoS suspicion detected.")
 
                 return function(*args, **kwargs)
 
@@ -63,4 +286,4 @@ def rate_limit(original_function=None, ip_based=False, limit=None):
     if original_function:
         return _decorate(original_function)
 
-    return _decorate
\ No newline at end of file
+    return _decorate
@@ -1,27 +1,27 @@
 ''' Libraries '''
+import logging
+flask_logger = logging.getLogger(name="flask")
 from flask import request
 from functools import wraps
 from .response import *
+from utils.schema import Schema, SchemaError
 
 
 
 ''' Settings '''
 __all__ = ["Request"]
-type_map = {
-    "int" : int,
-    "list": list,
-    "str" : str,
-    "dict": dict,
-    "bool": bool,
-    "None": type(None)
-}
 
 
 
 ''' Functions '''
 class _Request(type):
+    # @Request.json("[key]: [type]", ...), @Request.args(...), @Request.cookies(vars_dict={...}):
+    # the specs are compiled into a Schema once, when the view is decorated (see utils/schema.py).
+    # A value of the wrong type is answered with 400, a broken constraint with 403 and its message.
     def __getattr__(self, content_type):
-        def get(*keys, vars_dict={}):
+        def get(*keys, vars_dict=None, messages=None):
+            vars_dict = vars_dict or {}
+            schema = Schema(*keys, messages=messages)
             def data_func(func):
                 @wraps(func)
                 def wrapper(*args, **kwargs):
@@ -29,27 +29,10 @@ class _Request(type):
                     if data == None:
                         return HTTPError(f"Unaccepted Content-Type {content_type}.", 415)
                     try:
-                        # Magic
-                        kwargs.update({
-                            k: (lambda v: v if t is None or type(v) is t else int(''))
-                                (
-                                    data.get(
-                                        (
-                                            lambda s, *t: s + ''.join(map(
-                                                str.capitalize, t
-                                            ))
-                                        )(*filter(bool, k.split('_')))
-                                    )
-                                )
-                            # The part of "[key]: [type]" in '@Request.json("[key]: [type]")'
-                            for k, t in [(
-                                lambda x: (
-                                    x[0], type_map.get(x[1].strip()) if x[1:] else None
-                                )
-                            )(l.split(':', 1)) for l in keys]
-                        })
-                    except ValueError:
-                        return HTTPError("Requested Value With Wrong Type.", 400)
+                        kwargs.update(schema.validate(data))
+                    except SchemaError as ex:
+                        flask_logger.warning(f"SchemaError: IP '{request.remote_addr}' sent an invalid '{ex.key or 'body'}' to '{request.path}'.")
+                        return HTTPError(str(ex), 400 if ex.kind == "type" else 403)
                     kwargs.update({ v: data.get(vars_dict[v]) for v in vars_dict })
                     return func(*args, **kwargs)
 
@@ -61,4 +44,4 @@ class _Request(type):
 
 
 class Request(metaclass=_Request):
-    pass
\ No newline at end of file
+    pass
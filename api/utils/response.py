@@ -4,7 +4,7 @@ from flask import jsonify, redirect
 
 
 ''' Settings '''
-__all__ = ["HTTPResponse", "HTTPRedirect", "HTTPError"]
+__all__ = ["HTTPResponse", "HTTPRedirect", "HTTPError", "error_response"]
 
 
 
@@ -39,4 +39,11 @@ class HTTPRedirect(HTTPBaseResponese):
 class HTTPError(HTTPResponse):
     def __new__(cls, message, status_code, data=None, logout=False):
         cookies = {"jwt": None} if logout else {}
-        return super().__new__(HTTPResponse, message, status_code, "err", data, cookies)
\ No newline at end of file
+        return super().__new__(HTTPResponse, message, status_code, "err", data, cookies)
+
+
+def error_response(ex, status_code=404):
+    # An HTTPError as a Response object, for hooks such as `after_request` that cannot return a tuple
+    response, status_code = HTTPError(str(ex), status_code)
+    response.status_code = status_code
+    return response
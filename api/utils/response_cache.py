@@ -0,0 +1,146 @@
+''' Libraries '''
+import os
+import hashlib
+import threading
+from flask import request, make_response
+from functools import wraps
+
+from database.events import subscribe
+from utils.cache import TTLCache
+from utils.metrics import register_metrics
+
+
+
+''' Parameters '''
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", 2048))
+RESPONSE_CACHE_TTL  = int(os.environ.get("RESPONSE_CACHE_TTL", 30))
+
+
+
+''' Settings '''
+__all__ = ["ResponseCache", "response_cache"]
+
+
+
+''' Classes '''
+class _Entry():
+    __slots__ = ["body", "etag", "mimetype", "tags"]
+
+    def __init__(self, body, etag, mimetype, tags):
+        self.body     = body
+        self.etag     = etag
+        self.mimetype = mimetype
+        self.tags     = tags
+
+
+class ResponseCache():
+    # Caches successful JSON responses of anonymous catalogue reads. Entries are tagged with the
+    # products they contain and dropped when a write touches one of the tags; the TTL bounds the
+    # staleness of what is not invalidated (view counts, other workers' writes).
+
+    def __init__(self, maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL):
+        self.cache         = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.lock          = threading.Lock()
+        self.tags          = {}  # tag -> keys of the entries carrying it
+        self.version       = 0   # Bumped by every invalidation
+        self.bytes_saved   = 0
+        self.not_modified  = 0
+        self.invalidations = 0
+
+    def cached(self, key, tags):
+        # `key(**kwargs)` normalizes the request parameters, None skips the cache for this request;
+        # `tags(data)` names what the "data" of the response depends on
+        def decorate(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                params = key(**kwargs)
+                if params is None: return function(*args, **kwargs)
+                cache_key = (request.endpoint, params)
+
+                entry = self.cache.get(cache_key)
+                if entry is not None: return self._respond(entry, hit=True)
+
+                version  = self.version
+                response = make_response(function(*args, **kwargs))
+                if response.status_code != 200: return response
+                body  = response.get_data()
+                entry = _Entry(body, hashlib.sha1(body).hexdigest(), response.mimetype,
+                               set(tags(response.get_json()["data"])))
+                self._store(cache_key, entry, version)
+                return self._respond(entry, hit=False, response=response)
+            return wrapper
+        return decorate
+
+    def _store(self, cache_key, entry, version):
+        with self.lock:
+            # An invalidation while the response was being built may have made it stale already
+            if version != self.version: return
+            self.cache.set(cache_key, entry)
+            for tag in entry.tags:
+                keys = self.tags.setdefault(tag, set())
+                keys.add(cache_key)
+                if len(keys) > self.cache.maxsize:  # Forget the keys the LRU has evicted meanwhile
+                    with self.cache.lock: keys.intersection_update(self.cache.entries.keys())
+
+    def _respond(self, entry, hit, response=None):
+        if entry.etag in request.if_none_match:
+            with self.lock:
+                self.not_modified += 1
+                self.bytes_saved  += len(entry.body)
+            response = make_response("", 304)
+        else:
+            if hit:
+                with self.lock: self.bytes_saved += len(entry.body)
+                response = make_response(entry.body, 200)
+                response.mimetype = entry.mimetype
+        response.set_etag(entry.etag)
+        response.headers["X-Cache"] = "HIT" if hit else "MISS"
+        return response
+
+    def invalidate(self, *tags):
+        with self.lock:
+            self.version += 1
+            self.invalidations += 1
+            for tag in tags:
+                for cache_key in self.tags.pop(tag, ()):
+                    self.cache.pop(cache_key)
+
+    def clear(self):
+        with self.lock:
+            self.version += 1
+            self.tags = {}
+            self.cache.clear()
+
+    @property
+    def stats(self):
+        stats = self.cache.stats
+        with self.lock:
+            stats.update({
+                "bytesSaved"   : self.bytes_saved,
+                "notModified"  : self.not_modified,
+                "invalidations": self.invalidations,
+            })
+        return stats
+
+
+response_cache = ResponseCache()
+register_metrics("responseCache", lambda: response_cache.stats)
+
+
+
+''' Functions '''
+# "catalogue" and "ranking" are carried by the lists (top 10, search pages), whose order depends on
+# likes, and "product:<id>" by every response that shows the product.
+@subscribe("product_changed")
+def _on_product_changed(product):
+    response_cache.invalidate("catalogue", f"product:{product.product_id}")
+
+
+@subscribe("likes_changed")
+def _on_likes_changed(product_id, delta):
+    response_cache.invalidate("ranking", f"product:{product_id}")
+
+
+@subscribe("comment_created")
+def _on_comment_created(comment):
+    response_cache.invalidate(f"product:{comment.product_id}")
@@ -16,15 +16,16 @@ from werkzeug.middleware.proxy_fix import ProxyFix
 from api.auth    import auth_api
 from api.product import product_api
 from api.member  import member_api
+from api.metrics import metrics_api
+from api.utils.response import error_response
 from database.model import db
-
-
-
-''' Parameters '''
-DB_HOST     = os.environ.get("DB_HOST")
-DB_USER     = os.environ.get("DB_USER")
-DB_PASSWORD = os.environ.get("DB_PASSWORD")
-DB_NAME     = os.environ.get("DB_NAME")
+from database import engine, unit_of_work
+from database.engine import DATABASE_URI
+from database.migrate import migrate
+from database.leaderboard import leaderboard
+from api.utils.pubsub import notification_hub
+from database.view_buffer import view_buffer
+from database.compaction import connection_compactor
 
 
 
@@ -34,16 +35,24 @@ app = Flask(__name__)
 app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1)
 app.config["DEBUG"] = True
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-app.config["SQLALCHEMY_DATABASE_URI"] = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
+app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URI
 app.url_map.strict_slashes = False
 app.register_blueprint(auth_api,    url_prefix="/auth")
 app.register_blueprint(product_api, url_prefix="/product")
 app.register_blueprint(member_api,  url_prefix="/member")
+app.register_blueprint(metrics_api, url_prefix="/metrics")
 
 CORS(app, supports_credentials=True)
+engine.init_app(app, db)
 db.init_app(app)
+unit_of_work.init_app(app, on_commit_error=error_response)
+notification_hub.init_app(app)
+view_buffer.init_app(app)
+connection_compactor.init_app(app)
 with app.app_context():
     db.create_all()
+    migrate(db.engine)
+    leaderboard.build()
 
 
 
@@ -54,8 +63,10 @@ def test():
 
 
 ''' Run '''
-# app.run()
-app.run(ssl_context='adhoc')
-# app.run(ssl_context=("cert/cert1.pem", "cert/privkey1.pem"))
-# app.run(host="0.0.0.0", ssl_context=("cert/cert1.pem", "cert/privkey1.pem"))
-# app.run(host="0.0.0.0", port=4999, ssl_context=("cert/cert1.pem", "cert/privkey1.pem"))
\ No newline at end of file
+# Guarded so that manage.py can import the configured app without serving it
+if __name__ == "__main__":
+    # app.run()
+    app.run(ssl_context='adhoc')
+    # app.run(ssl_context=("cert/cert1.pem", "cert/privkey1.pem"))
+    # app.run(host="0.0.0.0", ssl_context=("cert/cert1.pem", "cert/privkey1.pem"))
+    # app.run(host="0.0.0.0", port=4999, ssl_context=("cert/cert1.pem", "cert/privkey1.pem"))
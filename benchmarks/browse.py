@@ -0,0 +1,93 @@
+''' Libraries '''
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+
+from common import create_app, measure, percentile
+from sqlalchemy import text
+from database.model import db, AccountEntity, ProductEntity, ProductCounter
+from database.loader import ProductLoader
+
+
+
+''' Settings '''
+LANGUAGES = [ "zh" ] * 6 + [ "en" ] * 3 + [ "ja" ]
+LOCATIONS = [ "台北", "新北", "桃園", "新竹", "台中", "台南", "高雄", "花蓮", "宜蘭", "金門" ]
+CHUNK     = 50000
+
+
+
+''' Functions '''
+def seed(products):
+    # Products of one seller and book are enough, browsing never filters on them
+    random.seed(0)
+    now = datetime.now()
+    db.session.execute(AccountEntity.__table__.insert(),
+                       [ { "username": "seller", "password": "-", "display_name": "seller", "email": "a@b", "phone": "0900000000" } ])
+    for start in range(0, products, CHUNK):
+        count = min(CHUNK, products - start)
+        db.session.execute(ProductEntity.__table__.insert(), [ {
+            "book_id": 1, "seller_id": 1, "name": f"product{start+i}", "price": random.randint(50, 1000), "images": [],
+            "for_sale": random.random() < 0.8, "sold_out": random.random() < 0.2, "condition": random.randint(1, 5),
+            "noted": random.random() < 0.5, "location": random.choice(LOCATIONS), "language": random.choice(LANGUAGES),
+            "extra_desc": "", "update_time": now - timedelta(seconds=random.randint(0, 86400 * 180)), "create_time": now,
+        } for i in range(count) ])
+        db.session.execute(ProductCounter.__table__.insert(), [
+            { "product_id": start + i + 1, "likes": int(random.paretovariate(1.5)) - 1, "views": 0 } for i in range(count)
+        ])
+        db.session.commit()
+    db.session.execute(text("ANALYZE"))
+
+
+def queries():
+    filters = {
+        "no filter"        : {},
+        "price 100-300"    : { "min_price": 100, "max_price": 300 },
+        "language+location": { "language": "ja", "location": "金門" },
+        "condition+noted"  : { "conditions": [ 4, 5 ], "noted": True },
+    }
+    return { f"{sort:<9} {name}": (sort, f) for sort in ("price", "priceDesc", "recent", "likes") for name, f in filters.items() }
+
+
+def browse(sort, filters, pages):
+    # The first `pages` pages of 20, as a client following nextCursor would fetch them
+    after = None
+    for _ in range(pages):
+        products, after = ProductEntity.browse(filters, sort, 20, after)
+        ProductLoader(products).overview_jsons()
+        if after is None: break
+
+
+def report(products, repeat, pages):
+    print(f"\n=== {products} products ===")
+    for name, (sort, filters) in queries().items():
+        db.session.rollback()
+        first = measure(lambda: browse(sort, filters, 1), repeat)
+        deep  = measure(lambda: browse(sort, filters, pages), max(repeat // pages, 5))
+        print(f"{name:<30} first page p50 {percentile(first, 50):7.2f} ms  p99 {percentile(first, 99):7.2f} ms"
+              f"   {pages} pages p50 {percentile(deep, 50):8.2f} ms  p99 {percentile(deep, 99):8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency of /product/browse queries on seeded SQLite databases.")
+    parser.add_argument("--sizes",  type=str, default="10000,100000,1000000")
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument("--pages",  type=int, default=10)
+    args = parser.parse_args()
+
+    for products in [ int(size) for size in args.sizes.split(',') ]:
+        app = create_app("sqlite://")
+        with app.app_context():
+            start = time.perf_counter()
+            seed(products)
+            print(f"\nSeeded {products} products in {time.perf_counter() - start:.1f} s")
+            report(products, args.repeat, args.pages)
+            db.session.remove()
+            db.engine.dispose()
+
+
+
+''' Run '''
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+''' Libraries '''
+import os
+import time
+import random
+import argparse
+import tempfile
+
+from common import create_app
+from sqlalchemy import event
+from database.model import db, AccountEntity, BookEntity, ProductEntity, ProductCounter
+from database.importer import import_products
+
+
+
+''' Functions '''
+def rows(count, books):
+    random.seed(0)
+    return [ {
+        "ISBN"            : f"978{random.randint(0, books):010d}",
+        "name"            : f"Textbook {i}",
+        "price"           : random.randint(50, 1000),
+        "images"          : [],
+        "condition"       : random.randint(1, 5),
+        "noted"           : random.random() < 0.5,
+        "location"        : "台北",
+        "language"        : "zh",
+        "extraDescription": "",
+    } for i in range(count) ]
+
+
+def one_by_one(seller_id, rows):
+    # What a script calling POST /member/products/new for every row costs the database
+    for r in rows:
+        ProductEntity(r["ISBN"], seller_id, r["name"], r["price"], r["images"], r["condition"],
+                      r["noted"], r["location"], r["language"], r["extraDescription"]).register()
+
+
+def failing_chunk(app, seller_id, rows, chunk_size=1000):
+    # import_products inside a request, as POST /member/products/import runs it, with the product
+    # INSERT of the first chunk failing; returns the number of imported products
+    calls = [0]
+    def fail_first_insert(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT INTO product ") and calls[0] == 0:
+            calls[0] += 1
+            raise RuntimeError("injected chunk failure")
+    event.listen(db.engine, "before_cursor_execute", fail_first_insert)
+    try:
+        with app.test_request_context():
+            app.preprocess_request()
+            imported, errors = import_products(seller_id, rows, chunk_size=chunk_size)
+            app.process_response(app.response_class())
+    finally:
+        event.remove(db.engine, "before_cursor_execute", fail_first_insert)
+    assert imported == len(rows) - chunk_size and len(errors) == chunk_size, (imported, len(errors))
+    return imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import against one register() per listing, on an on-disk SQLite file.")
+    parser.add_argument("--rows",  type=int, default=10000)
+    parser.add_argument("--books", type=int, default=3000)
+    parser.add_argument("--baseline-rows", type=int, default=1000, help="The per-row path is slow, time a sample of it.")
+    args = parser.parse_args()
+
+    for title, function, count in [
+        ("register() per row", lambda app, seller_id, rows: one_by_one(seller_id, rows),         args.baseline_rows),
+        ("import_products",    lambda app, seller_id, rows: import_products(seller_id, rows)[0], args.rows),
+        ("first chunk failing", failing_chunk,                                                  args.rows),
+    ]:
+        app = create_app(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'benchmark.db')}")
+        with app.app_context():
+            AccountEntity("seller", "password", "seller", "a@b", "0900000000").register()
+            start = time.perf_counter()
+            imported = function(app, 1, rows(count, args.books))
+            elapsed = time.perf_counter() - start
+            if imported is None: imported = count
+            # Every product was imported with its counter row and points at an existing book
+            dangling = ProductEntity.query.outerjoin(BookEntity, BookEntity.book_id == ProductEntity.book_id) \
+                                          .filter(BookEntity.book_id == None).count()
+            assert ProductEntity.query.count() == imported and ProductCounter.query.count() == imported, title
+            assert dangling == 0, f"{title}: {dangling} product(s) point at a missing book"
+        print(f"{title:<20} {count:6d} rows in {elapsed:7.2f} s   {count / elapsed:9.0f} rows/s")
+
+
+
+''' Run '''
+if __name__ == "__main__":
+    main()
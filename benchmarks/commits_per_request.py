@@ -0,0 +1,78 @@
+''' Libraries '''
+import os
+import time
+import argparse
+import tempfile
+from collections import defaultdict
+
+from common import create_app, percentile
+from sqlalchemy import event
+from database.model import db, AccountEntity, ProductEntity
+from api.model import Account
+
+
+
+''' Functions '''
+def seed(users, products):
+    for i in range(users):
+        AccountEntity(f"user{i}", "password", f"user{i}", "a@b", "0900000000").register()
+    for i in range(products):
+        product = ProductEntity(f"978{i:010d}", 1, f"product{i}", 100, [], 1, False, "台北", "zh", "")
+        product.register()
+        product.launch()
+
+
+def scenario(product_id):
+    # The write paths a logged-in user goes through on a product page
+    return [
+        ("view",    lambda c: c.get(f"/product/view?productId={product_id}")),
+        ("like",    lambda c: c.post("/product/like",    json={ "productId": product_id })),
+        ("comment", lambda c: c.post("/product/comment", json={ "productId": product_id, "content": "Still available?" })),
+        ("order",   lambda c: c.post("/product/order",   json={ "productId": product_id })),
+        ("unlike",  lambda c: c.delete("/product/like",  json={ "productId": product_id })),
+    ]
+
+
+def run(request_commit, users, products):
+    path = os.path.join(tempfile.mkdtemp(), "benchmark.db")  # On disk, so every COMMIT pays an fsync
+    app = create_app(f"sqlite:///{path}", request_commit=request_commit)
+    commits, durations = defaultdict(list), defaultdict(list)
+    with app.app_context():
+        seed(users, products)
+        counter = [0]
+        def count(conn): counter[0] += 1
+        event.listen(db.engine, "commit", count)
+        for i in range(1, users):
+            client = app.test_client()
+            client.environ_base["REMOTE_ADDR"] = f"10.0.{i // 250}.{i % 250}"
+            user = Account(); user.access(f"user{i}")
+            client.set_cookie("localhost", "jwt", user.jwt)
+            for name, request in scenario(i % products + 1):
+                counter[0] = 0
+                start = time.perf_counter()
+                response = request(client)
+                durations[name].append((time.perf_counter() - start) * 1000)
+                commits[name].append(counter[0])
+                assert response.status_code == 200, (name, response.get_json())
+        event.remove(db.engine, "commit", count)
+    return commits, durations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="COMMITs per request with per-method commits and with the request unit of work.")
+    parser.add_argument("--users",    type=int, default=200)
+    parser.add_argument("--products", type=int, default=20)
+    args = parser.parse_args()
+
+    for title, request_commit in [("per-method commits", False), ("unit of work", True)]:
+        commits, durations = run(request_commit, args.users, args.products)
+        print(f"\n=== {title} ===")
+        for name in commits:
+            print(f"{name:<8} commits/request {sum(commits[name]) / len(commits[name]):5.2f}   " + \
+                  f"p50 {percentile(durations[name], 50):7.2f} ms   p99 {percentile(durations[name], 99):7.2f} ms")
+
+
+
+''' Run '''
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+''' Libraries '''
+import os
+import sys
+import time
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_PATH)
+os.environ.setdefault("JWT_SECRET", "benchmark-secret")
+os.environ.setdefault("JWT_ISSUER", "benchmark")
+os.environ.setdefault("JWT_EXPIRE", "1")
+
+from flask import Flask
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.dialects.mysql import ENUM, TINYINT, SMALLINT
+
+
+
+''' Settings '''
+# Let the MySQL column types of database/model.py create tables on a local SQLite stand-in.
+# TINYINT/SMALLINT columns are rendered as INTEGER, which SQLite stores in up to 64 bits.
+@compiles(ENUM, "sqlite")
+def _compile_enum(element, compiler, **kwargs):
+    return "VARCHAR(20)"
+
+
+@compiles(TINYINT, "sqlite")
+@compiles(SMALLINT, "sqlite")
+def _compile_integer(element, compiler, **kwargs):
+    return "INTEGER"
+
+
+
+''' Functions '''
+def reset_state():
+    # Caches, indexes and the rate limiter live at module level and outlive an app: a benchmark that
+    # creates several apps on different databases starts each one from none of them
+    from api.model import account_cache
+    from api.utils.jwt import token_cache
+    from api.utils.rate_limit import set_backend, MemoryBackend
+    from api.utils.response_cache import response_cache
+    from database.book_stats import book_stats_cache
+    from database.isbn import isbn_cache
+    from database.leaderboard import leaderboard
+    from database.search import search_index
+    for cache in (account_cache, token_cache, response_cache, book_stats_cache, isbn_cache): cache.clear()
+    set_backend(MemoryBackend())
+    leaderboard.built_at = None
+    search_index.built_at = None
+
+
+def create_app(database_uri="sqlite://", request_commit=True, pool_options=None):
+    reset_state()
+    from api.auth    import auth_api
+    from api.product import product_api
+    from api.member  import member_api
+    from database.model import db
+    from database import engine, unit_of_work
+    from api.utils.response import error_response
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_uri
+    app.url_map.strict_slashes = False
+    app.register_blueprint(auth_api,    url_prefix="/auth")
+    app.register_blueprint(product_api, url_prefix="/product")
+    app.register_blueprint(member_api,  url_prefix="/member")
+    engine.init_app(app, db)
+    if pool_options is not None: app.config["SQLALCHEMY_ENGINE_OPTIONS"] = pool_options
+    db.init_app(app)
+    if request_commit: unit_of_work.init_app(app, on_commit_error=error_response)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def measure(function, repeat=20):
+    # Returns the duration of every run in milliseconds
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values)-1, int(round(p / 100 * (len(values)-1))))]
@@ -0,0 +1,87 @@
+''' Libraries '''
+import time
+import argparse
+from datetime import datetime
+from sqlalchemy import func
+
+from common import create_app
+from database.model import db, Connection, AccountEntity, BookEntity, ProductEntity, ProductCounter, \
+    CommentEntity, NotificationEntity, SeenRelationship, LikesRelationship
+from database.migrate import migrate
+
+
+
+''' Settings '''
+SMALLINT_MAX = 65535
+CHUNK        = 10000
+
+
+
+''' Functions '''
+def tables(rows):
+    # Model -> row factory, in insertion order; ids go past SMALLINT_MAX in every id column
+    now = datetime.now()
+    return {
+        Connection        : lambda i: { "target": f"10.{i >> 16}.{(i >> 8) & 255}.{i & 255}", "target_type": "IP",
+                                        "banned_turn": 0, "records": [] },
+        AccountEntity     : lambda i: { "username": f"user{i}", "password": "-", "display_name": f"user{i}",
+                                        "email": "a@b", "phone": "0900000000", "create_time": now },
+        BookEntity        : lambda i: { "ISBN": f"978{i:010d}", "create_time": now },
+        ProductEntity     : lambda i: { "book_id": i, "seller_id": i, "name": f"product{i}", "price": 100, "images": [],
+                                        "for_sale": True, "sold_out": False, "condition": 1, "noted": False,
+                                        "location": "台北", "language": "zh", "extra_desc": "",
+                                        "update_time": now, "create_time": now },
+        ProductCounter    : lambda i: { "product_id": i, "likes": 1, "views": 1 },
+        CommentEntity     : lambda i: { "product_id": i, "user_id": i, "content": "-", "create_time": now },
+        NotificationEntity: lambda i: { "user_id": i, "read": False, "content": "-", "create_time": now },
+        SeenRelationship  : lambda i: { "user_id": i, "product_id": rows + 1 - i, "recent_time": now, "create_time": now },
+        LikesRelationship : lambda i: { "user_id": i, "product_id": rows + 1 - i, "create_time": now },
+    }
+
+
+def fill(model, row, rows):
+    # Appends `rows` rows in chunks of one executemany and one commit, returns rows per second
+    start = time.perf_counter()
+    for first in range(1, rows + 1, CHUNK):
+        db.session.execute(model.__table__.insert(), [ row(i) for i in range(first, min(first + CHUNK, rows + 1)) ])
+        db.session.commit()
+    return rows / (time.perf_counter() - start)
+
+
+def check(model):
+    # Largest value of every id column, and the row holding the largest key read back through the ORM
+    columns = [ c for c in model.__table__.columns if c.name.endswith("_id") ]
+    largest = db.session.query(*[ func.max(c) for c in columns ]).one()
+    key_columns = list(model.__table__.primary_key.columns)
+    key = db.session.query(*key_columns).order_by(*[ c.desc() for c in key_columns ]).first()
+    found = db.session.get(model, tuple(key)) is not None
+    return dict(zip([ c.name for c in columns ], largest)), found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Insert past the old SMALLINT ceiling (65,535) in every table.")
+    parser.add_argument("--database-uri", default="sqlite://",
+                        help="An empty database, or a MySQL one still on SMALLINT ids to run m0007_widen_ids first.")
+    parser.add_argument("--rows", type=int, default=70000)
+    args = parser.parse_args()
+
+    app = create_app(args.database_uri)
+    with app.app_context():
+        applied = migrate(db.engine)
+        if len(applied) > 0: print(f"Applied {', '.join(applied)}")
+        failed = False
+        for model, row in tables(args.rows).items():
+            rate = fill(model, row, args.rows)
+            largest, found = check(model)
+            ok = found and all(value > SMALLINT_MAX for value in largest.values())
+            failed = failed or not ok
+            print(f"{model.__tablename__:<16} {args.rows} rows {rate:9.0f} rows/s   "
+                  f"max {', '.join(f'{k}={v}' for k, v in largest.items())}   {'ok' if ok else 'FAILED'}")
+        db.session.remove()
+    if failed: raise SystemExit(1)
+
+
+
+''' Run '''
+if __name__ == "__main__":
+    main()
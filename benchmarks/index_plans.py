@@ -0,0 +1,104 @@
+''' Libraries '''
+import random
+import argparse
+from datetime import datetime, timedelta
+
+from common import create_app, measure, percentile
+from sqlalchemy import text
+from database.model import db, AccountEntity, BookEntity, ProductEntity, ProductCounter, \
+    NotificationEntity, LikesRelationship, SeenRelationship
+
+
+
+''' Functions '''
+def seed(users, products, likes, notifications):
+    random.seed(0)
+    now = datetime.now()
+    def ago(): return now - timedelta(seconds=random.randint(0, 86400 * 180))
+    db.session.execute(AccountEntity.__table__.insert(), [
+        { "username": f"user{i}", "password": "-", "display_name": f"user{i}", "email": "a@b", "phone": "0900000000" }
+        for i in range(users)
+    ])
+    db.session.execute(BookEntity.__table__.insert(), [ { "ISBN": f"978{i:010d}" } for i in range(products // 10) ])
+    db.session.execute(ProductEntity.__table__.insert(), [
+        { "book_id": random.randint(1, products // 10), "seller_id": random.randint(1, users), "name": f"product{i}",
+          "price": random.randint(50, 1000), "images": [], "for_sale": random.random() < 0.7, "sold_out": random.random() < 0.2,
+          "condition": random.randint(1, 5), "noted": False, "location": "台北", "language": "zh", "extra_desc": "",
+          "update_time": ago(), "create_time": ago() }
+        for i in range(products)
+    ])
+    pairs = set((random.randint(1, users), random.randint(1, products)) for _ in range(likes))
+    db.session.execute(LikesRelationship.__table__.insert(),
+                       [ { "user_id": u, "product_id": p, "create_time": ago() } for u, p in pairs ])
+    db.session.execute(SeenRelationship.__table__.insert(),
+                       [ { "user_id": u, "product_id": p, "recent_time": ago(), "create_time": ago() } for u, p in pairs ])
+    db.session.execute(NotificationEntity.__table__.insert(), [
+        { "user_id": random.randint(1, users), "read": False, "content": "-", "create_time": ago() }
+        for _ in range(notifications)
+    ])
+    db.session.commit()
+    ProductCounter.reconcile()
+
+
+def queries(users, products):
+    user_id, product_id = users // 2, products // 2
+    since = datetime.now() - timedelta(days=1)
+    return {
+        "seller products page": lambda: ProductEntity.seller_page(user_id, "forSale", 20),
+        "top-10 by likes"     : lambda: ProductEntity.browse({}, "likes", 10),
+        "likes of a product"  : lambda: LikesRelationship.query.filter_by(product_id=product_id).count(),
+        "views of a product"  : lambda: SeenRelationship.query.filter_by(product_id=product_id).count(),
+        "new notifications"   : lambda: NotificationEntity.query.filter(NotificationEntity.user_id == user_id,
+                                                                       NotificationEntity.create_time > since).all(),
+        "history page"        : lambda: AccountEntity.query.get(user_id).history(20),
+    }
+
+
+def explain(function):
+    # SQLite's plan of every statement the function runs
+    plans = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+            plans.append(" / ".join(row[-1] for row in rows))
+    from sqlalchemy import event
+    event.listen(db.engine, "before_cursor_execute", record)
+    try: function()
+    finally: event.remove(db.engine, "before_cursor_execute", record)
+    return plans
+
+
+def report(title, users, products, repeat):
+    print(f"\n=== {title} ===")
+    for name, function in queries(users, products).items():
+        db.session.rollback()
+        plans = explain(function)
+        durations = measure(function, repeat)
+        print(f"{name:<22} p50 {percentile(durations, 50):8.2f} ms   p99 {percentile(durations, 99):8.2f} ms")
+        for plan in plans: print(f"{'':<24}{plan}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query plans and timings before/after the secondary indexes.")
+    parser.add_argument("--users",         type=int, default=2000)
+    parser.add_argument("--products",      type=int, default=50000)
+    parser.add_argument("--likes",         type=int, default=200000)
+    parser.add_argument("--notifications", type=int, default=100000)
+    parser.add_argument("--repeat",        type=int, default=50)
+    args = parser.parse_args()
+
+    app = create_app("sqlite://")
+    with app.app_context():
+        seed(args.users, args.products, args.likes, args.notifications)
+        indexes = [ index for table in db.metadata.sorted_tables for index in table.indexes ]
+        for index in indexes: index.drop(bind=db.engine)
+        report("before (primary keys only)", args.users, args.products, args.repeat)
+        for index in indexes: index.create(bind=db.engine)
+        db.session.execute(text("ANALYZE"))
+        report("after (secondary indexes)", args.users, args.products, args.repeat)
+
+
+
+''' Run '''
+if __name__ == "__main__":
+    main()
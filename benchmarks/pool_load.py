@@ -0,0 +1,91 @@
+''' Libraries '''
+import os
+import time
+import random
+import argparse
+import collections
+import tempfile
+import threading
+
+from common import create_app, percentile
+from sqlalchemy.pool import NullPool
+from database.model import db, AccountEntity, ProductEntity
+from database.engine import engine_options, pool_stats
+
+
+
+''' Functions '''
+def seed(products):
+    AccountEntity("seller", "password", "seller", "a@b", "0900000000").register()
+    for i in range(products):
+        product = ProductEntity(f"978{i:010d}", 1, f"product{i}", 100, [], 1, False, "台北", "zh", "")
+        product.register()
+        product.launch()
+
+
+def load(app, threads, requests, products, network):
+    # Every thread plays anonymous clients browsing the front page and product pages. Each request comes
+    # from its own address, so the rate limiter never bans a thread; `network` keeps different runs apart
+    durations, errors = [], collections.Counter()
+    lock = threading.Lock()
+
+    def client(index):
+        random.seed(index)
+        test_client = app.test_client()
+        for n in range(requests):
+            address = index * requests + n
+            url = "/product/" if n % 4 == 0 else f"/product/view?productId={random.randint(1, products)}"
+            start = time.perf_counter()
+            response = test_client.get(url, environ_base={ "REMOTE_ADDR": f"10.{network}.{address // 250}.{address % 250}" })
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                durations.append(elapsed)
+                if response.status_code != 200: errors[response.status_code] += 1
+
+    workers = [ threading.Thread(target=client, args=(i,)) for i in range(threads) ]
+    start = time.perf_counter()
+    for worker in workers: worker.start()
+    for worker in workers: worker.join()
+    return durations, errors, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load against an on-disk SQLite stand-in with different pool settings.")
+    parser.add_argument("--threads",  type=int, default=32)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--products", type=int, default=200)
+    args = parser.parse_args()
+    # One address per request out of 10.<run>.0.0/16
+    if args.threads * args.requests > 250 * 250: parser.error("at most 62500 requests per run")
+
+    failed = False
+    for network, (title, overrides) in enumerate([
+        ("no pooling (connect per checkout)", None),
+        ("pool 4, no overflow",               { "pool_size": 4, "max_overflow": 0 }),
+        ("pool 10, overflow 20 (default)",    {}),
+    ], start=1):
+        uri = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'benchmark.db')}"
+        if overrides is None: options = { "poolclass": NullPool, "connect_args": { "check_same_thread": False } }
+        else                : options = { **engine_options(uri), **overrides }
+        app = create_app(uri, pool_options=options)
+        with app.app_context():
+            seed(args.products)
+            durations, errors, elapsed = load(app, args.threads, args.requests, args.products, network)
+            stats = pool_stats(db.engine)
+        print(f"\n=== {title} ===")
+        if len(errors) > 0:
+            # Latencies of error responses say nothing about the pool
+            codes = ", ".join(f"{count} x {code}" for code, count in sorted(errors.items()))
+            print(f"FAILED: {sum(errors.values())} of {len(durations)} requests were not answered with 200 ({codes})")
+            failed = True
+            continue
+        print(f"{len(durations) / elapsed:8.1f} req/s   p50 {percentile(durations, 50):7.2f} ms   " + \
+              f"p99 {percentile(durations, 99):7.2f} ms   errors 0")
+        print(f"pool {stats}")
+    if failed: raise SystemExit(1)
+
+
+
+''' Run '''
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+''' Libraries '''
+import os
+import time
+import argparse
+import tempfile
+import multiprocessing
+
+import common  # Puts the repository on sys.path
+from api.utils.rate_limit import SharedMemoryBackend
+
+
+
+''' Settings '''
+TARGET = "10.0.0.1"
+_preloaded = None  # Opened before forking with --preload, inherited by the workers
+
+
+
+''' Functions '''
+def hammer(path, target, now, hits):
+    # One pre-fork worker: `hits` requests of the same target within one window, returns what hit() counted
+    backend = _preloaded if _preloaded is not None else SharedMemoryBackend(path)
+    return [ int(backend.hit(target, now)) for _ in range(hits) ]
+
+
+def ban(path, target, accept_time, banned_turn):
+    SharedMemoryBackend(path).set_ban(target, accept_time, banned_turn)
+
+
+def main():
+    global _preloaded
+    parser = argparse.ArgumentParser(description="Several processes on one RATE_LIMIT_SHM_PATH hit the same target; "
+                                                 "the count and the ban must be exact.")
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--hits",      type=int, default=5000, help="Requests per process")
+    parser.add_argument("--limit",     type=int, default=60)
+    parser.add_argument("--path",      help="Shared memory file, emptied first; a temporary one by default")
+    parser.add_argument("--preload",   action="store_true",
+                        help="Open the file once before forking (gunicorn --preload) instead of once per process.")
+    args = parser.parse_args()
+
+    path = args.path or os.path.join(tempfile.mkdtemp(), "rate_limit.shm")
+    if os.path.exists(path): os.remove(path)
+    if args.preload: _preloaded = SharedMemoryBackend(path)
+    context = multiprocessing.get_context("fork")
+    total = args.processes * args.hits
+    # A fixed timestamp keeps every request within one window, so the expected counts are exact
+    now = time.time()
+
+    start = time.perf_counter()
+    with context.Pool(args.processes) as pool:
+        counts = pool.starmap(hammer, [ (path, TARGET, now, args.hits) ] * args.processes)
+    elapsed = time.perf_counter() - start
+    print(f"{args.processes} processes x {args.hits} hits   {total / elapsed:9.0f} hits/s")
+
+    failures = []
+    # Every increment is seen by exactly one request: the counts returned are 1..total, each once
+    returned = sorted(count for process in counts for count in process)
+    if returned != list(range(1, total + 1)):
+        lost = total - len(set(returned))
+        failures.append(f"counts are not 1..{total} ({lost} lost or duplicated, largest {returned[-1]})")
+    final = int(SharedMemoryBackend(path).hit(TARGET, now))
+    if final != total + 1: failures.append(f"total {final - 1}, expected {total}")
+
+    # The decorator bans on the first request counted above the limit: exactly `limit` pass, one process bans
+    allowed = sum(count <= args.limit for count in returned)
+    banning = sum(args.limit + 1 in process for process in counts)
+    print(f"allowed {allowed} of limit {args.limit}, processes banning {banning}")
+    if allowed != min(args.limit, total): failures.append(f"{allowed} requests allowed, limit is {args.limit}")
+    if total > args.limit and banning != 1: failures.append(f"{banning} processes banned, expected 1")
+
+    # A ban set by one process is seen by the others
+    accept_time = now + 60
+    process = context.Process(target=ban, args=(path, TARGET, accept_time, 1))
+    process.start()
+    process.join()
+    known, seen_accept_time, banned_turn = SharedMemoryBackend(path).get_ban(TARGET)
+    print(f"ban seen by another process: known {known}, accept_time +{(seen_accept_time or now) - now:.0f} s, turn {banned_turn}")
+    if not known or seen_accept_time != accept_time or banned_turn != 1: failures.append("ban not shared")
+
+    if not args.path: os.remove(path)
+    for failure in failures: print(f"FAILED: {failure}")
+    if len(failures) > 0: raise SystemExit(1)
+    print("ok")
+
+
+
+''' Run '''
+if __name__ == "__main__":
+    main()
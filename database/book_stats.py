@@ -0,0 +1,65 @@
+''' Libraries '''
+import os
+from collections import Counter
+
+from database.events import subscribe
+from database.model import db, ProductEntity
+from utils.cache import TTLCache
+from utils.metrics import register_metrics
+
+
+
+''' Parameters '''
+BOOK_STATS_CACHE_SIZE = int(os.environ.get("BOOK_STATS_CACHE_SIZE", 4096))
+BOOK_STATS_CACHE_TTL  = int(os.environ.get("BOOK_STATS_CACHE_TTL", 600))
+
+
+
+''' Settings '''
+__all__ = ["book_stats", "book_stats_cache"]
+# book_id -> stats of its copies on sale, dropped whenever one of its products changes
+book_stats_cache = TTLCache(maxsize=BOOK_STATS_CACHE_SIZE, ttl=BOOK_STATS_CACHE_TTL)
+register_metrics("bookStatsCache", lambda: book_stats_cache.stats)
+
+
+
+''' Functions '''
+def _summary(rows):
+    # rows: (price, condition) sorted by price
+    prices = [ price for price, _ in rows ]
+    count  = len(prices)
+    if count == 0:
+        median = None
+    elif count % 2 == 1:
+        median = prices[count // 2]
+    else:
+        median = (prices[count // 2 - 1] + prices[count // 2] + 1) // 2  # An int like the prices, halves rounded up
+    return {
+        "count"      : count,
+        "minPrice"   : prices[0]  if count > 0 else None,
+        "medianPrice": median,
+        "maxPrice"   : prices[-1] if count > 0 else None,
+        "conditions" : dict(sorted(Counter(str(condition) for _, condition in rows).items())),
+    }
+
+
+def book_stats(book_id):
+    # `book_id` None (a book nobody has listed) gives the stats of no copies
+    if book_id is None: return _summary([])
+    stats = book_stats_cache.get(book_id)
+    if stats is None:
+        # One range scan over ix_product_book_status_price, already sorted by price
+        rows = db.session.query(ProductEntity.price, ProductEntity.condition) \
+                         .filter(ProductEntity.book_id == book_id, ProductEntity.for_sale == True,
+                                 ProductEntity.sold_out == False) \
+                         .order_by(ProductEntity.price).all()
+        stats = _summary(rows)
+        book_stats_cache.set(book_id, stats)
+    return stats
+
+
+@subscribe("product_changed")
+def _on_product_changed(product):
+    # A copy enters or leaves the stats only through launch/discontinue/out_of_stock, and its book
+    # and price can only be edited while it is off sale, so the product's current book is enough.
+    book_stats_cache.pop(product.book_id)
@@ -0,0 +1,93 @@
+''' Libraries '''
+import os
+import time
+import logging
+import threading
+
+from database.model import Connection
+from utils.metrics import register_metrics
+
+
+
+''' Parameters '''
+CONNECTION_TTL              = int(os.environ.get("CONNECTION_TTL", 86400 * 30))     # Seconds before an idle, unbanned target is deleted
+CONNECTION_MAX_RECORDS      = int(os.environ.get("CONNECTION_MAX_RECORDS", 20))     # Timestamps kept in `records`
+CONNECTION_COMPACT_INTERVAL = int(os.environ.get("CONNECTION_COMPACT_INTERVAL", 3600))
+
+
+
+''' Settings '''
+__all__ = ["ConnectionCompactor", "connection_compactor"]
+
+
+
+''' Classes '''
+class ConnectionCompactor():
+    # Runs Connection.compact every `interval` seconds in a background thread. Every worker runs its own,
+    # the deletes are idempotent so overlapping runs only cost a few empty queries.
+
+    def __init__(self, ttl=CONNECTION_TTL, max_records=CONNECTION_MAX_RECORDS, interval=CONNECTION_COMPACT_INTERVAL):
+        self.ttl         = ttl
+        self.max_records = max_records
+        self.interval    = interval
+        self.lock        = threading.Lock()
+        self.pid         = None  # Process the thread runs in
+        self.runs        = 0
+        self.failures    = 0
+        self.deleted     = 0
+        self.trimmed     = 0
+        self.last_run    = None
+        self.duration    = 0.0
+
+    def init_app(self, app):
+        self.app = app
+        app.before_request(self._start)
+
+    def _start(self):
+        # Started by the first request of each process, not at import, so that the workers of a
+        # pre-fork server (gunicorn --preload) each get one instead of only the master
+        if self.pid == os.getpid(): return
+        with self.lock:
+            if self.pid == os.getpid(): return
+            self.pid = os.getpid()
+        threading.Thread(target=self._run, name="connection-compactor", daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                with self.app.app_context():
+                    self.run()
+            except Exception as ex:
+                with self.lock: self.failures += 1
+                logging.error(f"Connection compaction failed: {str(ex)}")
+
+    def run(self):
+        # Returns (deleted rows, trimmed rows) of this run
+        start = time.perf_counter()
+        deleted, trimmed = Connection.compact(self.ttl, self.max_records)
+        with self.lock:
+            self.runs    += 1
+            self.deleted += deleted
+            self.trimmed += trimmed
+            self.last_run = time.time()
+            self.duration = time.perf_counter() - start
+        if deleted or trimmed:
+            logging.info(f"Connection compaction: {deleted} idle row(s) deleted, {trimmed} row(s) trimmed.")
+        return deleted, trimmed
+
+    @property
+    def stats(self):
+        with self.lock:
+            return {
+                "runs"      : self.runs,
+                "failures"  : self.failures,
+                "deleted"   : self.deleted,
+                "trimmed"   : self.trimmed,
+                "lastRun"   : self.last_run,
+                "durationMs": round(self.duration * 1000, 1),
+            }
+
+
+connection_compactor = ConnectionCompactor()
+register_metrics("connectionCompaction", lambda: connection_compactor.stats)
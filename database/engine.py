@@ -1,8 +1,12 @@
 ''' Libraries '''
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import scoped_session, sessionmaker
-from sqlalchemy.ext.declarative import declarative_base
+import time
+import threading
+from sqlalchemy import create_engine, exc
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.engine import make_url
+
+from utils.metrics import register_metrics
 
 
 
@@ -11,24 +15,102 @@ DB_HOST     = os.environ.get("DB_HOST")
 DB_USER     = os.environ.get("DB_USER")
 DB_PASSWORD = os.environ.get("DB_PASSWORD")
 DB_NAME     = os.environ.get("DB_NAME")
+DB_POOL_SIZE     = int(os.environ.get("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW  = int(os.environ.get("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT  = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+DB_POOL_RECYCLE  = int(os.environ.get("DB_POOL_RECYCLE", 1800))  # Below MySQL's wait_timeout (28800 by default)
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_REPLICA_HOSTS  = [ host.strip() for host in os.environ.get("DB_REPLICA_HOSTS", "").split(",") if host.strip() ]
+DB_REPLICA_STICKY = float(os.environ.get("DB_REPLICA_STICKY", 5))  # Seconds a client reads from the primary after writing
 
 
 
-''' Script '''
+''' Settings '''
+__all__ = ["DATABASE_URI", "DATABASE_REPLICA_URIS", "InstrumentedQueuePool", "engine_options", "make_engine", "pool_stats", "init_app"]
 DATABASE_URI = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
-engine = create_engine(DATABASE_URI, convert_unicode=True)
-scoped_session_object = scoped_session(sessionmaker(autocommit=False,
-                                                    autoflush=False,
-                                                    bind=engine))
-Base = declarative_base()
-Base.query = scoped_session_object.query_property()
-db_session = scoped_session_object()
-
-
-
-''' Function '''
-def init_db():
-    from database.model import Connection, \
-        AccountEntity, BookEntity, ProductEntity, CommentEntity, \
-        NotificationEntity, LikesRelationship, SeenRelationship
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+DATABASE_REPLICA_URIS = [ f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{host}/{DB_NAME}" for host in DB_REPLICA_HOSTS ]
+
+
+
+''' Classes '''
+class InstrumentedQueuePool(QueuePool):
+    # QueuePool that also records how long checkouts wait; the counters restart if the pool is recreated
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts   = 0
+        self.wait_total  = 0.0
+        self.wait_max    = 0.0
+        self.timeouts    = 0
+
+    def connect(self):
+        # Time from asking for a connection to holding one: queueing for a free slot plus, when the
+        # pool grows or recycles, opening the connection and the pre-ping round trip
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            with self._stats_lock: self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts  += 1
+                self.wait_total += waited
+                self.wait_max    = max(self.wait_max, waited)
+
+
+
+''' Functions '''
+def engine_options(uri=DATABASE_URI):
+    # Options shared by Flask-SQLAlchemy (SQLALCHEMY_ENGINE_OPTIONS) and `make_engine`
+    url = make_url(uri)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return {}  # In-memory SQLite lives in a single connection, pooling does not apply
+    options = {
+        "poolclass"   : InstrumentedQueuePool,
+        "pool_size"   : DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if url.get_backend_name() == "sqlite":
+        options["connect_args"] = { "check_same_thread": False }
+    return options
+
+
+def make_engine(uri=DATABASE_URI):
+    # For code running outside Flask; inside the app use `db.engine`
+    return create_engine(uri, **engine_options(uri))
+
+
+def pool_stats(engine):
+    pool = engine.pool
+    if not isinstance(pool, QueuePool): return { "pool": type(pool).__name__ }
+    stats = {
+        "pool"      : type(pool).__name__,
+        "size"      : pool.size(),
+        "checkedIn" : pool.checkedin(),
+        "checkedOut": pool.checkedout(),
+        "overflow"  : max(pool.overflow(), 0),
+    }
+    if isinstance(pool, InstrumentedQueuePool):
+        with pool._stats_lock:
+            stats.update({
+                "checkouts"  : pool.checkouts,
+                "timeouts"   : pool.timeouts,
+                "waitAvgMs"  : pool.wait_total / pool.checkouts * 1000 if pool.checkouts else 0.0,
+                "waitMaxMs"  : pool.wait_max * 1000,
+            })
+    return stats
+
+
+def init_app(app, db):
+    # Call before `db.init_app(app)`, so Flask-SQLAlchemy builds its engine with the pool settings
+    app.config.setdefault("SQLALCHEMY_DATABASE_URI", DATABASE_URI)
+    app.config.setdefault("SQLALCHEMY_REPLICA_URIS", DATABASE_REPLICA_URIS)
+    app.config.setdefault("SQLALCHEMY_REPLICA_STICKY", DB_REPLICA_STICKY)
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
+    register_metrics("databasePool", lambda: pool_stats(db.get_engine(app)))
@@ -0,0 +1,27 @@
+''' Libraries '''
+import logging
+from collections import defaultdict
+
+
+
+''' Settings '''
+__all__ = ["subscribe", "emit"]
+_subscribers = defaultdict(list)
+
+
+
+''' Functions '''
+def subscribe(event):
+    def decorate(function):
+        _subscribers[event].append(function)
+        return function
+    return decorate
+
+
+def emit(event, *args, **kwargs):
+    # A failing subscriber must not break the write that triggered the event
+    for function in _subscribers[event]:
+        try:
+            function(*args, **kwargs)
+        except Exception as ex:
+            logging.error(f"Event '{event}' subscriber '{function.__name__}' failed: {str(ex)}")
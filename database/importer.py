@@ -0,0 +1,125 @@
+''' Libraries '''
+import csv
+import json
+from datetime import datetime
+from sqlalchemy import and_
+
+from database.model import db, ProductEntity, ProductCounter
+from database.isbn import normalize_isbn, resolve_book_ids
+from database.unit_of_work import commit
+from utils.exceptions import DataInvalidException
+from utils.schema import Schema, SchemaError
+
+
+
+''' Settings '''
+__all__ = ["PRODUCT_SCHEMA", "IMPORT_MAX_ROWS", "validate_product", "read_rows", "import_products"]
+# The fields of `POST /member/products/new`, also checked on every imported row
+PRODUCT_SCHEMA = Schema(
+    "ISBN: str", "name: str", "price: int(0..65535)", "images: list[str](..10)", "condition: int(0..255)",
+    "noted: bool", "location: str(..30)", "language: str(..10)", "extra_description: str(..1000)",
+    messages={
+        "price"            : "Price invalid.",
+        "condition"        : "Condition invalid.",
+        "images"           : "Images invalid.",
+        "location"         : "Location invalid.",
+        "language"         : "Language invalid.",
+        "extra_description": "Extra description invalid.",
+    })
+IMPORT_CHUNK_SIZE = 1000
+IMPORT_MAX_ROWS   = 10000  # Per HTTP request, the CLI has no limit
+
+
+
+''' Functions '''
+def validate_product(ISBN, name, price, images, condition, noted, location, language, extra_description):
+    # Rules of a new listing beyond PRODUCT_SCHEMA, returns the cleaned values or raises DataInvalidException(field)
+    ISBN = normalize_isbn(ISBN)
+    name = name.strip()
+    if ISBN is None                    : raise DataInvalidException("ISBN")
+    if len(name) == 0 or len(name) > 30: raise DataInvalidException("Name")
+    return ISBN, name, price, images, condition, noted, location, language, extra_description
+
+
+def _csv_row(row):
+    # CSV cells are strings: images is a JSON list or "|"-separated URLs, noted is true/false/1/0
+    row = dict(row)
+    try:
+        row["price"]     = int(row["price"])
+        row["condition"] = int(row["condition"])
+    except (KeyError, TypeError):
+        raise ValueError("price/condition")
+    images = (row.get("images") or "").strip()
+    row["images"] = json.loads(images) if images.startswith('[') else [ i for i in images.split('|') if i ]
+    noted = (row.get("noted") or "").strip().lower()
+    if noted not in ("true", "false", "1", "0", ""): raise ValueError("noted")
+    row["noted"] = noted in ("true", "1")
+    row["extraDescription"] = row.get("extraDescription") or ""
+    return row
+
+
+PARSERS = {
+    "json" : lambda row: row,
+    "jsonl": json.loads,
+    "csv"  : _csv_row,
+}
+
+
+def read_rows(file, format):
+    # Raw rows of a CSV file (header line with the JSON keys) or of a JSONL file, parsed by `import_products`
+    if format == "csv"  : return list(csv.DictReader(file))
+    if format == "jsonl": return [ line for line in file if line.strip() ]
+    raise ValueError(format)
+
+
+def import_products(seller_id, rows, format="json", chunk_size=IMPORT_CHUNK_SIZE):
+    # Validates every row, then inserts the valid ones in chunks of one executemany and one commit each.
+    # Returns the number of imported products and the errors as [{"row": index, "error": message}].
+    parse, errors, valid = PARSERS[format], [], []
+    for index, row in enumerate(rows):
+        try:
+            valid.append((index, validate_product(**PRODUCT_SCHEMA.validate(parse(row)))))
+        except DataInvalidException as ex:
+            errors.append({ "row": index, "error": f"{ex} invalid." })
+        except SchemaError as ex:
+            errors.append({ "row": index, "error": str(ex) })
+        except ValueError as ex:
+            errors.append({ "row": index, "error": f"Requested Value With Wrong Type ({ex})." })
+    if len(valid) == 0: return 0, errors
+
+    # Committed before the chunks: inside a request resolve_book_ids only flushes, and the rollback
+    # of a failed chunk would take the new books with it while later chunks still point at them
+    books = resolve_book_ids([ values[0] for _, values in valid ])
+    commit(immediate=True)
+    imported = 0
+    for start in range(0, len(valid), chunk_size):
+        chunk, now = valid[start:start+chunk_size], datetime.now()
+        try:
+            db.session.execute(ProductEntity.__table__.insert(), [ {
+                "book_id"    : books[ISBN],
+                "seller_id"  : seller_id,
+                "name"       : name,
+                "price"      : price,
+                "images"     : images,
+                "for_sale"   : False,
+                "sold_out"   : False,
+                "condition"  : condition,
+                "noted"      : noted,
+                "location"   : location,
+                "language"   : language,
+                "extra_desc" : extra_description,
+                "update_time": now,
+                "create_time": now,
+            } for _, (ISBN, name, price, images, condition, noted, location, language, extra_description) in chunk ])
+            # Counter rows for the new products, with one INSERT ... SELECT
+            new_products = db.session.query(ProductEntity.product_id) \
+                                     .outerjoin(ProductCounter, ProductCounter.product_id == ProductEntity.product_id) \
+                                     .filter(and_(ProductEntity.seller_id == seller_id, ProductCounter.product_id == None))
+            db.session.execute(ProductCounter.__table__.insert().from_select(["product_id"], new_products.statement))
+            commit(immediate=True)
+            imported += len(chunk)
+        except Exception as ex:
+            db.session.rollback()
+            errors.extend({ "row": index, "error": f"Database error: {str(ex)}" } for index, _ in chunk)
+    errors.sort(key=lambda error: error["row"])
+    return imported, errors
@@ -0,0 +1,112 @@
+''' Libraries '''
+import os
+from datetime import datetime
+from sqlalchemy import func
+from sqlalchemy.dialects import mysql, sqlite
+
+from database.events import subscribe
+from database.model import db, BookEntity
+from database.unit_of_work import commit, emit
+from utils.cache import TTLCache
+from utils.metrics import register_metrics
+
+
+
+''' Parameters '''
+ISBN_CACHE_SIZE = int(os.environ.get("ISBN_CACHE_SIZE", 65536))
+ISBN_CACHE_TTL  = int(os.environ.get("ISBN_CACHE_TTL", 86400))
+
+
+
+''' Settings '''
+__all__ = ["normalize_isbn", "resolve_book_id", "resolve_book_ids", "find_book_id", "isbn_cache"]
+SQL_IN_LIMIT = 900  # Bound parameters per IN (...) list, below SQLite's default limit of 999
+# (engine, ISBN-13) -> book_id, filled only with committed rows; book ids never change so a hit needs no query.
+# Keyed by engine as well: a process pointing several apps at different databases (benchmarks, CLI) gets
+# the ids of the database it is talking to.
+isbn_cache = TTLCache(maxsize=ISBN_CACHE_SIZE, ttl=ISBN_CACHE_TTL)
+register_metrics("isbnCache", lambda: isbn_cache.stats)
+
+
+
+''' Functions '''
+def normalize_isbn(ISBN):
+    # "957-08-1234-X", "9789570812345" ... -> the ISBN-13 digits, or None if it is not 10 or 13 characters long
+    ISBN = ISBN.replace('-', '').replace(' ', '').upper()
+    if len(ISBN) == 13 and ISBN.isdigit():
+        return ISBN
+    if len(ISBN) == 10 and ISBN[:9].isdigit() and (ISBN[9].isdigit() or ISBN[9] == 'X'):
+        body  = "978" + ISBN[:9]
+        check = (10 - sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(body)) % 10) % 10
+        return body + str(check)
+    return None
+
+
+def _key(ISBN):
+    return (db.engine, ISBN)
+
+
+def _insert_books(ISBNs):
+    # Inserts the ISBNs that do not exist yet without failing on the ones that do (or that a
+    # concurrent request inserts meanwhile). MySQL reports the id of a single ISBN through
+    # LAST_INSERT_ID either way; other databases need a SELECT afterwards.
+    rows = [ { "ISBN": ISBN, "create_time": datetime.now() } for ISBN in ISBNs ]
+    dialect = db.engine.dialect.name
+    if dialect == "mysql" and len(rows) == 1:
+        insert = mysql.insert(BookEntity.__table__).values(rows) \
+                      .on_duplicate_key_update(book_id=func.LAST_INSERT_ID(BookEntity.__table__.c.book_id))
+        return { rows[0]["ISBN"]: db.session.execute(insert).lastrowid }
+    if   dialect == "mysql" : insert = mysql.insert(BookEntity.__table__).prefix_with("IGNORE")
+    elif dialect == "sqlite": insert = sqlite.insert(BookEntity.__table__).on_conflict_do_nothing(index_elements=["ISBN"])
+    else                    : raise NotImplementedError(dialect)
+    db.session.execute(insert, rows)
+    return _lookup(ISBNs)
+
+
+def _lookup(ISBNs):
+    ISBNs, books = list(ISBNs), {}
+    for i in range(0, len(ISBNs), SQL_IN_LIMIT):
+        books.update(db.session.query(BookEntity.ISBN, BookEntity.book_id)
+                               .filter(BookEntity.ISBN.in_(ISBNs[i:i+SQL_IN_LIMIT])).all())
+    return books
+
+
+def resolve_book_ids(ISBNs):
+    # normalized ISBN -> book_id, creating the missing books; costs no query when every ISBN is cached
+    ISBNs = set(normalize_isbn(ISBN) or ISBN for ISBN in ISBNs)
+    books = {}
+    for ISBN in ISBNs:
+        book_id = isbn_cache.get(_key(ISBN))
+        if book_id is not None: books[ISBN] = book_id
+    missing = ISBNs - set(books)
+    if len(missing) == 0: return books
+
+    # Look up before inserting: a MySQL insert that hits the unique key still burns an auto-increment id
+    found = _lookup(missing)
+    for ISBN, book_id in found.items(): isbn_cache.set(_key(ISBN), book_id)
+    created = _insert_books(missing - set(found)) if len(missing) > len(found) else {}
+    commit()
+    # Cached once the request commits, a rolled-back insert must not leave a dangling id behind
+    for ISBN, book_id in created.items(): emit("book_resolved", ISBN, book_id)
+    books.update(found)
+    books.update(created)
+    return books
+
+
+def resolve_book_id(ISBN):
+    return next(iter(resolve_book_ids([ ISBN ]).values()))
+
+
+def find_book_id(ISBN):
+    # Like resolve_book_id for readers: None for an unknown ISBN instead of creating the book
+    ISBN = normalize_isbn(ISBN) or ISBN
+    book_id = isbn_cache.get(_key(ISBN))
+    if book_id is None:
+        book_id = _lookup([ ISBN ]).get(ISBN)
+        if book_id is not None: isbn_cache.set(_key(ISBN), book_id)
+    return book_id
+
+
+@subscribe("book_resolved")
+def _on_book_resolved(ISBN, book_id):
+    isbn_cache.set(_key(ISBN), book_id)
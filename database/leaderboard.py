@@ -0,0 +1,120 @@
+''' Libraries '''
+import os
+import time
+import bisect
+import threading
+from sqlalchemy import func
+
+from database.events import subscribe
+from database.model import db, ProductEntity, ProductCounter
+
+
+
+''' Parameters '''
+LEADERBOARD_REFRESH = int(os.environ.get("LEADERBOARD_REFRESH", 600))  # Seconds between rebuilds from the DB
+
+
+
+''' Settings '''
+__all__ = ["Leaderboard", "leaderboard"]
+CATEGORIES = ("language", "location")
+
+
+
+''' Classes '''
+class Leaderboard():
+    # For-sale, not sold-out products ordered by likes (desc) then product_id: the "likes" sort of
+    # ProductEntity.browse, except that ties go to the oldest product first. One sorted list of
+    # (-likes, product_id) for all products and one per language and per location, kept in step by
+    # the like and product events. The periodic rebuild picks up the likes and status changes made
+    # by other worker processes.
+
+    def __init__(self):
+        self.lock     = threading.RLock()
+        self.built_at = None
+
+    def build(self):
+        likes = func.coalesce(ProductCounter.likes, 0)
+        rows = db.session.query(ProductEntity.product_id, likes, ProductEntity.language, ProductEntity.location) \
+                         .outerjoin(ProductCounter, ProductCounter.product_id == ProductEntity.product_id) \
+                         .filter(ProductEntity.for_sale == True, ProductEntity.sold_out == False).all()
+        with self.lock:
+            self.entries = {}  # product_id -> (likes, language, location)
+            self.ranking = []
+            self.categories = { category: {} for category in CATEGORIES }  # category -> value -> ranking
+            for product_id, likes, language, location in rows:
+                self._add(product_id, likes, language, location)
+            self.built_at = time.monotonic()
+        return
+
+    def _ensure_built(self):
+        if self.built_at is None or time.monotonic() - self.built_at > LEADERBOARD_REFRESH:
+            self.build()
+
+    def _lists(self, language, location):
+        return [ self.ranking,
+                 self.categories["language"].setdefault(language, []),
+                 self.categories["location"].setdefault(location, []) ]
+
+    def _add(self, product_id, likes, language, location):
+        self.entries[product_id] = (likes, language, location)
+        for ranking in self._lists(language, location):
+            bisect.insort(ranking, (-likes, product_id))
+
+    def _remove(self, product_id):
+        entry = self.entries.pop(product_id, None)
+        if entry is None: return None
+        likes, language, location = entry
+        for ranking in self._lists(language, location):
+            index = bisect.bisect_left(ranking, (-likes, product_id))
+            if index < len(ranking) and ranking[index] == (-likes, product_id): del ranking[index]
+        return entry
+
+    def top(self, n=10, language=None, location=None):
+        # Returns [(product_id, likes)] without touching the database (except for the periodic rebuild)
+        self._ensure_built()
+        with self.lock:
+            if language is not None and location is not None:
+                ranking = [ key for key in self.categories["language"].get(language, [])
+                            if self.entries[key[1]][2] == location ]
+            elif language is not None: ranking = self.categories["language"].get(language, [])
+            elif location is not None: ranking = self.categories["location"].get(location, [])
+            else                     : ranking = self.ranking
+            return [ (product_id, -likes) for likes, product_id in ranking[:n] ]
+
+    def update_product(self, product):
+        if self.built_at is None: return
+        listed = product.for_sale and not product.sold_out
+        likes  = 0
+        if listed and product.product_id not in self.entries:  # Newly launched, read its likes once
+            likes = ProductEntity.like_counts([ product.product_id ]).get(product.product_id, 0)
+        with self.lock:
+            entry = self._remove(product.product_id)
+            if listed:
+                if entry is not None: likes = entry[0]
+                self._add(product.product_id, likes, product.language, product.location)
+        return
+
+    def update_likes(self, product_id, delta):
+        with self.lock:
+            if self.built_at is None: return
+            entry = self._remove(product_id)
+            if entry is None: return
+            likes, language, location = entry
+            self._add(product_id, max(likes + delta, 0), language, location)
+        return
+
+
+leaderboard = Leaderboard()
+
+
+
+''' Functions '''
+@subscribe("product_changed")
+def _on_product_changed(product):
+    leaderboard.update_product(product)
+
+
+@subscribe("likes_changed")
+def _on_likes_changed(product_id, delta):
+    leaderboard.update_likes(product_id, delta)
@@ -0,0 +1,115 @@
+''' Libraries '''
+from database.model import AccountEntity, BookEntity, ProductEntity, CommentEntity
+
+
+
+''' Settings '''
+__all__ = ["ProductLoader"]
+
+
+
+''' Classes '''
+class ProductLoader():
+    # Resolves the relations of a list of products with one `IN (...)` query per relation,
+    # each loaded on first use, so serializing N products costs a fixed number of queries.
+
+    def __init__(self, products, likes=None, views=None):
+        self.products    = list(products)
+        self.product_ids = [ p.product_id for p in self.products ]
+        self._loaded     = {}
+        if likes is not None: self._loaded["likes"] = likes
+        if views is not None: self._loaded["views"] = views
+
+    def _load(self, relation, function):
+        if relation not in self._loaded:
+            self._loaded[relation] = function() if len(self.products) > 0 else {}
+        return self._loaded[relation]
+
+    @staticmethod
+    def _accounts(user_ids):
+        if len(user_ids) == 0: return {}
+        accounts = AccountEntity.query.filter(AccountEntity.user_id.in_(user_ids)).all()
+        return { a.user_id: a for a in accounts }
+
+    @property
+    def sellers(self):
+        return self._load("sellers", lambda: self._accounts(set([ p.seller_id for p in self.products ])))
+
+    @property
+    def books(self):
+        def load():
+            book_ids = set([ p.book_id for p in self.products ])
+            return { b.book_id: b for b in BookEntity.query.filter(BookEntity.book_id.in_(book_ids)).all() }
+        return self._load("books", load)
+
+    @property
+    def counts(self):
+        return self._load("counts", lambda: ProductEntity.counts(self.product_ids))
+
+    @property
+    def likes(self):
+        return self._load("likes", lambda: { pid: c[0] for pid, c in self.counts.items() })
+
+    @property
+    def views(self):
+        return self._load("views", lambda: { pid: c[1] for pid, c in self.counts.items() })
+
+    @property
+    def comments(self):
+        # product_id -> comment JSONs in posting order, from one range scan over
+        # (product_id, create_time) plus one query for the authors
+        def load():
+            comments = CommentEntity.query.filter(CommentEntity.product_id.in_(self.product_ids)) \
+                                          .order_by(CommentEntity.product_id, CommentEntity.create_time,
+                                                    CommentEntity.comment_id).all()
+            authors  = self._accounts(set([ c.user_id for c in comments ]))
+            jsons = {}
+            for c in comments:
+                jsons.setdefault(c.product_id, []).append({
+                    "displayName": authors[c.user_id].display_name,
+                    "content"    : c.content,
+                    "commentTime": c.create_time,
+                })
+            return jsons
+        return self._load("comments", load)
+
+    def overview_json(self, product):
+        return {
+            "productId"        : product.product_id,
+            "sellerDisplayName": self.sellers[product.seller_id].display_name,
+            "name"             : product.name,
+            "price"            : product.price,
+            "likes"            : self.likes.get(product.product_id, 0),
+            "views"            : self.views.get(product.product_id, 0),
+            "images"           : product.images,
+            "soldOut"          : product.sold_out,
+            "extraDescription" : product.extra_desc,
+        }
+
+    def detail_json(self, product):
+        return {
+            "productId"        : product.product_id,
+            "ISBN"             : self.books[product.book_id].ISBN,
+            "sellerDisplayName": self.sellers[product.seller_id].display_name,
+            "name"             : product.name,
+            "price"            : product.price,
+            "likes"            : self.likes.get(product.product_id, 0),
+            "views"            : self.views.get(product.product_id, 0),
+            "images"           : product.images,
+            "forSale"          : product.for_sale,
+            "soldOut"          : product.sold_out,
+            "condition"        : product.condition,
+            "noted"            : product.noted,
+            "location"         : product.location,
+            "language"         : product.language,
+            "extraDescription" : product.extra_desc,
+            "comments"         : self.comments.get(product.product_id, []),
+            "createTime"       : product.create_time,
+            "updateTime"       : product.update_time,
+        }
+
+    def overview_jsons(self):
+        return [ self.overview_json(p) for p in self.products ]
+
+    def detail_jsons(self):
+        return [ self.detail_json(p) for p in self.products ]
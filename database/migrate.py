@@ -0,0 +1,97 @@
+''' Libraries '''
+import os
+import logging
+import importlib
+from datetime import datetime
+from sqlalchemy import text, inspect, MetaData, Table, Column, Index
+
+
+
+''' Parameters '''
+MIGRATION_LOCK_TIMEOUT = int(os.environ.get("MIGRATION_LOCK_TIMEOUT", 3600))  # Seconds a worker waits for another one's migrations
+
+
+
+''' Settings '''
+__all__ = ["MIGRATIONS", "migrate", "has_column", "has_index", "add_column", "frozen_index", "create_index"]
+# Applied in order and recorded in `schema_migrations`. Fresh databases already get the final
+# schema from db.create_all(), so every upgrade must check before it changes anything.
+MIGRATIONS = [
+    "m0001_comment_product_id",
+    "m0002_secondary_indexes",
+    "m0003_notification_read_index",
+    "m0004_normalize_isbn",
+    "m0005_book_price_index",
+    "m0006_browse_indexes",
+    "m0007_widen_ids",
+    "m0008_connection_update_time",
+    "m0009_backfill_product_counters",
+]
+
+
+
+''' Helpers '''
+def has_column(engine, table, column):
+    return column in [ c["name"] for c in inspect(engine).get_columns(table) ]
+
+
+def has_index(engine, table, index):
+    return index in [ i["name"] for i in inspect(engine).get_indexes(table) ]
+
+
+def add_column(engine, column):
+    # `column` is a model Column, its type is rendered for the engine's dialect.
+    # Added as NULL-able so existing rows stay valid until they are backfilled.
+    if has_column(engine, column.table.name, column.name): return False
+    column_type = column.type.compile(dialect=engine.dialect)
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {column.table.name} ADD COLUMN {column.name} {column_type} NULL"))
+    return True
+
+
+def frozen_index(name, table, *columns):
+    # An Index as a migration defines it, on a stand-in of `table` holding only `columns`, so a
+    # migration keeps creating the same index whatever database/model.py declares later
+    stand_in = Table(table, MetaData(), *[ Column(column) for column in columns ])
+    return Index(name, *[ stand_in.c[column] for column in columns ])
+
+
+def create_index(engine, index):
+    # `index` is one from frozen_index, skipped when the table already has an index of that name
+    if has_index(engine, index.table.name, index.name): return False
+    index.create(bind=engine)
+    return True
+
+
+
+''' Functions '''
+def migrate(engine):
+    # Every worker migrates when the app is imported. On MySQL they queue on a named lock held by
+    # a dedicated connection, and the ones that get it after the first find the migrations recorded.
+    if engine.dialect.name != "mysql": return _migrate(engine)
+    with engine.connect() as lock:
+        acquired = lock.execute(text("SELECT GET_LOCK('schema_migrations', :timeout)"),
+                                { "timeout": MIGRATION_LOCK_TIMEOUT }).scalar()
+        if acquired != 1: raise RuntimeError("Timed out waiting for another process to apply the migrations.")
+        try:
+            return _migrate(engine)
+        finally:
+            lock.execute(text("SELECT RELEASE_LOCK('schema_migrations')"))
+
+
+def _migrate(engine):
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE IF NOT EXISTS schema_migrations ("
+                          "version VARCHAR(64) PRIMARY KEY, applied_time DATETIME NOT NULL)"))
+        applied = set(version for version, in conn.execute(text("SELECT version FROM schema_migrations")))
+
+    newly_applied = []
+    for version in MIGRATIONS:
+        if version in applied: continue
+        logging.info(f"Applying migration '{version}'.")
+        importlib.import_module(f"database.migrations.{version}").upgrade(engine)
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO schema_migrations (version, applied_time) VALUES (:version, :time)"),
+                         { "version": version, "time": datetime.now() })
+        newly_applied.append(version)
+    return newly_applied
@@ -0,0 +1,35 @@
+''' Libraries '''
+import json
+from sqlalchemy import text, bindparam
+
+from database.model import CommentEntity
+from database.migrate import has_column, add_column, frozen_index, create_index
+
+
+
+''' Parameters '''
+CHUNK_SIZE = 500
+
+
+
+''' Functions '''
+def upgrade(engine):
+    # Comments used to be linked through the JSON list `product.comments`;
+    # they now carry their own product_id indexed with create_time.
+    add_column(engine, CommentEntity.__table__.c.product_id)
+    create_index(engine, frozen_index("ix_comment_product_time", "comment", "product_id", "create_time"))
+
+    if not has_column(engine, "product", "comments"): return
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT product_id, comments FROM product WHERE comments IS NOT NULL")).all()
+
+    update = text("UPDATE comment SET product_id = :product_id "
+                  "WHERE comment_id IN :comment_ids AND product_id IS NULL") \
+                 .bindparams(bindparam("comment_ids", expanding=True))
+    for product_id, comment_ids in rows:
+        if isinstance(comment_ids, str): comment_ids = json.loads(comment_ids)
+        for i in range(0, len(comment_ids), CHUNK_SIZE):
+            with engine.begin() as conn:
+                conn.execute(update, { "product_id": product_id, "comment_ids": comment_ids[i:i+CHUNK_SIZE] })
+    # The JSON column is left in place (no longer written) so the backfill can be re-run or audited
+    return
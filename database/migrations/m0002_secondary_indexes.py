@@ -0,0 +1,36 @@
+''' Libraries '''
+from database.migrate import frozen_index, create_index
+
+
+
+''' Settings '''
+# Chosen from the query shapes in api/*.py:
+#   product (seller_id, update_time)     - /member/products, keyset by update_time per seller
+#   product (for_sale, sold_out)         - top-10 ranking of for-sale products (replaced in m0006)
+#   product (book_id)                    - products listed for a book (replaced in m0005)
+#   product_counter (likes)              - top-N by likes without sorting the catalogue
+#   notification (user_id, create_time)  - per-user notifications, newest first
+#   likes (user_id, create_time), seen (user_id, recent_time)
+#                                        - collection and history pages
+#   likes (product_id), seen (product_id)
+#                                        - reverse lookups, the primary keys start with user_id
+INDEXES = [
+    frozen_index("ix_product_seller_update",    "product",         "seller_id", "update_time"),
+    frozen_index("ix_product_status",           "product",         "for_sale", "sold_out"),
+    frozen_index("ix_product_book",             "product",         "book_id"),
+    frozen_index("ix_product_counter_likes",    "product_counter", "likes"),
+    frozen_index("ix_notification_user_time",   "notification",    "user_id", "create_time"),
+    frozen_index("ix_likes_user_time",          "likes",           "user_id", "create_time"),
+    frozen_index("ix_seen_user_time",           "seen",            "user_id", "recent_time"),
+    frozen_index("ix_likes_product",            "likes",           "product_id"),
+    frozen_index("ix_seen_product",             "seen",            "product_id"),
+]
+
+
+
+''' Functions '''
+def upgrade(engine):
+    # The indexes as they were declared when this migration was written, the ones since replaced included
+    for index in INDEXES:
+        create_index(engine, index)
+    return
@@ -0,0 +1,10 @@
+''' Libraries '''
+from database.migrate import frozen_index, create_index
+
+
+
+''' Functions '''
+def upgrade(engine):
+    # (user_id, read) backs the unread-count endpoint and the bulk mark-as-read UPDATE
+    create_index(engine, frozen_index("ix_notification_user_read", "notification", "user_id", "read"))
+    return
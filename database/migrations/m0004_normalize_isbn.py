@@ -0,0 +1,28 @@
+''' Libraries '''
+from sqlalchemy import text
+
+from database.isbn import normalize_isbn
+
+
+
+''' Functions '''
+def upgrade(engine):
+    # Books are now stored under their ISBN-13. Rewrite the other spellings (ISBN-10, hyphens),
+    # merging a book into the existing row of the same ISBN-13 and moving its products there.
+    with engine.connect() as conn:
+        books = dict(conn.execute(text("SELECT ISBN, book_id FROM book")).all())
+
+    for ISBN, book_id in list(books.items()):
+        normalized = normalize_isbn(ISBN)
+        if normalized is None or normalized == ISBN: continue
+        with engine.begin() as conn:
+            target = books.get(normalized)
+            if target is None:
+                conn.execute(text("UPDATE book SET ISBN = :ISBN WHERE book_id = :book_id"),
+                             { "ISBN": normalized, "book_id": book_id })
+                books[normalized] = book_id
+            else:
+                conn.execute(text("UPDATE product SET book_id = :target WHERE book_id = :book_id"),
+                             { "target": target, "book_id": book_id })
+                conn.execute(text("DELETE FROM book WHERE book_id = :book_id"), { "book_id": book_id })
+    return
@@ -0,0 +1,17 @@
+''' Libraries '''
+from sqlalchemy import text
+
+from database.migrate import has_index, frozen_index, create_index
+
+
+
+''' Functions '''
+def upgrade(engine):
+    # (book_id, for_sale, sold_out, price) serves the copies of a book on sale ordered by price,
+    # and its book_id prefix replaces the single-column ix_product_book from m0002.
+    create_index(engine, frozen_index("ix_product_book_status_price", "product", "book_id", "for_sale", "sold_out", "price"))
+    if has_index(engine, "product", "ix_product_book"):
+        with engine.begin() as conn:
+            if engine.dialect.name == "mysql": conn.execute(text("DROP INDEX ix_product_book ON product"))
+            else                             : conn.execute(text("DROP INDEX ix_product_book"))
+    return
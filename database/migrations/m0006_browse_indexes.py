@@ -0,0 +1,18 @@
+''' Libraries '''
+from sqlalchemy import text
+
+from database.migrate import has_index, frozen_index, create_index
+
+
+
+''' Functions '''
+def upgrade(engine):
+    # (for_sale, sold_out, price) and (for_sale, sold_out, update_time) serve /product/browse sorted by
+    # price and by recency, and their (for_sale, sold_out) prefix replaces ix_product_status from m0002.
+    create_index(engine, frozen_index("ix_product_browse_price",  "product", "for_sale", "sold_out", "price"))
+    create_index(engine, frozen_index("ix_product_browse_update", "product", "for_sale", "sold_out", "update_time"))
+    if has_index(engine, "product", "ix_product_status"):
+        with engine.begin() as conn:
+            if engine.dialect.name == "mysql": conn.execute(text("DROP INDEX ix_product_status ON product"))
+            else                             : conn.execute(text("DROP INDEX ix_product_status"))
+    return
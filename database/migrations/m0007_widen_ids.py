@@ -0,0 +1,101 @@
+''' Libraries '''
+import os
+import time
+import logging
+from sqlalchemy import text, inspect
+from sqlalchemy.types import SmallInteger
+
+from database.model import db
+
+
+
+''' Parameters '''
+CHUNK_SIZE  = int(os.environ.get("MIGRATION_CHUNK_SIZE", 5000))     # Rows copied per statement
+CHUNK_PAUSE = float(os.environ.get("MIGRATION_CHUNK_PAUSE", 0.05))  # Seconds between chunks, to leave room for the application
+
+
+
+''' Functions '''
+def upgrade(engine):
+    # Every *_id column was SMALLINT UNSIGNED (at most 65,535 rows), they become INT UNSIGNED.
+    # SQLite stores any INTEGER as 64 bits, so only MySQL has something to do. An ALTER TABLE would
+    # copy the table under a metadata lock, each table is instead rebuilt online:
+    #   1. an empty shadow table `_<table>_new` with the wide columns,
+    #   2. triggers that replay every write on the table into the shadow table,
+    #   3. the rows copied over in primary-key chunks with INSERT IGNORE (rows the triggers wrote are newer),
+    #   4. an atomic RENAME TABLE swap, then the old table is dropped along with its triggers.
+    # An interrupted run leaves the original table in place and is started over by the next one.
+    # Creating triggers needs the TRIGGER privilege (and SUPER or log_bin_trust_function_creators with binary logging).
+    if engine.dialect.name != "mysql": return
+    for table in db.metadata.sorted_tables:
+        columns = narrow_columns(engine, table.name)
+        if len(columns) > 0: rebuild_online(engine, table.name, columns)
+    return
+
+
+def narrow_columns(engine, table):
+    inspector = inspect(engine)
+    if not inspector.has_table(table): return []
+    return [ c for c in inspector.get_columns(table)
+             if c["name"].endswith("_id") and isinstance(c["type"], SmallInteger) ]
+
+
+def _column_definition(column):
+    definition = f"`{column['name']}` INT UNSIGNED {'NULL' if column['nullable'] else 'NOT NULL'}"
+    if column.get("autoincrement") is True: definition += " AUTO_INCREMENT"
+    return definition
+
+
+def rebuild_online(engine, table, columns):
+    new, old = f"_{table}_new", f"_{table}_old"
+    inspector = inspect(engine)
+    names = [ c["name"] for c in inspector.get_columns(table) ]
+    keys  = inspector.get_pk_constraint(table)["constrained_columns"]
+    column_list = ", ".join(f"`{name}`" for name in names)
+    logging.info(f"Widening {', '.join(c['name'] for c in columns)} of '{table}' online.")
+
+    with engine.begin() as conn:
+        _drop_triggers(conn, table)
+        conn.execute(text(f"DROP TABLE IF EXISTS `{new}`"))
+        conn.execute(text(f"CREATE TABLE `{new}` LIKE `{table}`"))
+        conn.execute(text(f"ALTER TABLE `{new}` " + ", ".join(f"MODIFY {_column_definition(c)}" for c in columns)))
+        replay = f"REPLACE INTO `{new}` ({column_list}) VALUES ({', '.join(f'NEW.`{name}`' for name in names)})"
+        match  = " AND ".join(f"`{key}` = OLD.`{key}`" for key in keys)
+        remove = f"DELETE FROM `{new}` WHERE {match}"
+        conn.execute(text(f"CREATE TRIGGER `{table}_widen_ins` AFTER INSERT ON `{table}` FOR EACH ROW {replay}"))
+        # An UPDATE may change the primary key, the row under the OLD key goes before the NEW one is written
+        conn.execute(text(f"CREATE TRIGGER `{table}_widen_upd` AFTER UPDATE ON `{table}` FOR EACH ROW "
+                          f"BEGIN {remove}; {replay}; END"))
+        conn.execute(text(f"CREATE TRIGGER `{table}_widen_del` AFTER DELETE ON `{table}` FOR EACH ROW {remove}"))
+
+    copied = copy_chunks(engine, table, new, keys[0], column_list)
+    with engine.begin() as conn:
+        conn.execute(text(f"RENAME TABLE `{table}` TO `{old}`, `{new}` TO `{table}`"))
+        conn.execute(text(f"DROP TABLE `{old}`"))
+    logging.info(f"Widened '{table}', {copied} row(s) copied.")
+    return copied
+
+
+def copy_chunks(engine, source, target, key, column_list, chunk_size=CHUNK_SIZE, pause=CHUNK_PAUSE):
+    # Walks `source` in ranges of the first primary-key column, one short transaction per chunk.
+    # A range ends on a key value, so rows of a composite key sharing it are copied together.
+    copied, last = 0, None
+    while True:
+        with engine.begin() as conn:
+            where = f"WHERE `{key}` > :last" if last is not None else ""
+            upper = conn.execute(text(f"SELECT `{key}` FROM `{source}` {where} ORDER BY `{key}` "
+                                      f"LIMIT 1 OFFSET {chunk_size - 1}"), { "last": last }).scalar()
+            if upper is None:
+                upper = conn.execute(text(f"SELECT MAX(`{key}`) FROM `{source}` {where}"), { "last": last }).scalar()
+                if upper is None: return copied
+            bounds = f"{where + ' AND' if where else 'WHERE'} `{key}` <= :upper"
+            copied += conn.execute(text(f"INSERT IGNORE INTO `{target}` ({column_list}) "
+                                        f"SELECT {column_list} FROM `{source}` {bounds}"),
+                                   { "last": last, "upper": upper }).rowcount
+        last = upper
+        if pause > 0: time.sleep(pause)
+
+
+def _drop_triggers(conn, table):
+    for suffix in ("ins", "upd", "del"):
+        conn.execute(text(f"DROP TRIGGER IF EXISTS `{table}_widen_{suffix}`"))
@@ -0,0 +1,18 @@
+''' Libraries '''
+from datetime import datetime
+from sqlalchemy import text
+
+from database.model import Connection
+from database.migrate import add_column, frozen_index, create_index
+
+
+
+''' Functions '''
+def upgrade(engine):
+    # `connections.update_time` tells Connection.compact which targets are idle. The time of the last
+    # ban or unban of existing rows is unknown, they start from now and get a full TTL.
+    add_column(engine, Connection.__table__.c.update_time)
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE connections SET update_time = :now WHERE update_time IS NULL"), { "now": datetime.now() })
+    create_index(engine, frozen_index("ix_connection_update_time", "connections", "update_time"))
+    return
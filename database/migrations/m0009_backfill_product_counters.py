@@ -0,0 +1,31 @@
+''' Libraries '''
+import os
+from sqlalchemy import text
+
+
+
+''' Parameters '''
+CHUNK_SIZE = int(os.environ.get("MIGRATION_CHUNK_SIZE", 5000))  # Products recounted per statement
+
+
+
+''' Functions '''
+def upgrade(engine):
+    # `product_counter` came without its rows: products listed before it had no counter, and the first
+    # like of one created it with a count of 1. Like ProductCounter.reconcile, every product gets a row
+    # and its counts are rebuilt from `likes` and `seen`, in product_id ranges of one transaction each.
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO product_counter (product_id, likes, views) "
+                          "SELECT product.product_id, 0, 0 FROM product "
+                          "LEFT JOIN product_counter ON product_counter.product_id = product.product_id "
+                          "WHERE product_counter.product_id IS NULL"))
+        last = conn.execute(text("SELECT MAX(product_id) FROM product_counter")).scalar() or 0
+
+    for start in range(0, last, CHUNK_SIZE):
+        with engine.begin() as conn:
+            conn.execute(text("UPDATE product_counter SET "
+                              "likes = (SELECT COUNT(*) FROM likes WHERE likes.product_id = product_counter.product_id), "
+                              "views = (SELECT COUNT(*) FROM seen WHERE seen.product_id = product_counter.product_id) "
+                              "WHERE product_id > :start AND product_id <= :end"),
+                         { "start": start, "end": start + CHUNK_SIZE })
+    return
@@ -2,25 +2,32 @@
 import pytz
 import hashlib
 from datetime import datetime, timedelta
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Column
+from sqlalchemy import Column, Index, func, and_, or_, case
+from sqlalchemy.dialects import mysql, sqlite
 from sqlalchemy.dialects.mysql import \
-    TINYINT, SMALLINT, VARCHAR, TEXT, CHAR, BOOLEAN, DATETIME, ENUM, JSON
+    TINYINT, SMALLINT, INTEGER, VARCHAR, TEXT, CHAR, BOOLEAN, DATETIME, ENUM, JSON
+
+from database.routing import RoutingSQLAlchemy
+from database.unit_of_work import commit, emit
 
 
 
 ''' Models '''
 TZ_TW = pytz.timezone("Asia/Taipei")
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()  # Reads of GET requests may go to a replica, see database/routing.py
 
 class Connection(db.Model):
     __tablename__ = 'connections'
-    connection_id = Column(SMALLINT(unsigned=True), primary_key=True)
+    __table_args__ = (
+        Index("ix_connection_update_time", "update_time"),
+    )
+    connection_id = Column(INTEGER(unsigned=True),  primary_key=True)
     target        = Column(VARCHAR(39), nullable=False, unique=True)  # Length of IPv6 = 39
     target_type   = Column(ENUM("IP", "username"), nullable=False)
     banned_turn   = Column(TINYINT(unsigned=True), default=0)
     accept_time   = Column(DATETIME)
     records       = Column(JSON)
+    update_time   = Column(DATETIME, default=datetime.now)  # Last ban or unban, see Connection.compact
 
     def __init__(self, target, target_type):
         self.target      = target
@@ -29,33 +36,62 @@ class Connection(db.Model):
 
     def register(self):
         db.session.add(self)
-        db.session.commit()
-        return
-
-    def access(self):
-        last_second = datetime.now() - timedelta(seconds=1)
-        self.records = list(filter(lambda d: d >= last_second.timestamp(), self.records))
-        self.records.append(datetime.now().timestamp())
-        db.session.commit()
+        commit()
         return
 
     def ban(self):
         self.records = []
         self.banned_turn += 1
         self.accept_time = datetime.now() + timedelta(hours=1)
-        db.session.commit()
+        self.update_time = datetime.now()
+        # The banned request is answered with an error, which would roll the ban back
+        commit(immediate=True)
         return
 
     def unban(self):
-        self.records.append(datetime.now().timestamp())
+        # A new list, the JSON column does not track in-place changes
+        self.records = (self.records or []) + [ datetime.now().timestamp() ]
         self.accept_time = None
-        db.session.commit()
+        self.update_time = datetime.now()
+        commit()
         return
 
+    @staticmethod
+    def compact(ttl, max_records, chunk_size=1000):
+        # Deletes the targets that are not banned and have not been banned or unbanned for `ttl` seconds,
+        # and trims the `records` of the others to the last `max_records` timestamps within `ttl`.
+        # Works in chunks of one commit each; returns (deleted rows, trimmed rows).
+        now = datetime.now()
+        idle = and_(Connection.update_time < now - timedelta(seconds=ttl),
+                    or_(Connection.accept_time < now, Connection.accept_time == None))
+        deleted = 0
+        while True:
+            ids = [ cid for cid, in db.session.query(Connection.connection_id).filter(idle).limit(chunk_size).all() ]
+            if len(ids) == 0: break
+            deleted += Connection.query.filter(Connection.connection_id.in_(ids), idle) \
+                                       .delete(synchronize_session=False)
+            commit(immediate=True)
+
+        trimmed, last, oldest = 0, 0, now.timestamp() - ttl
+        while True:
+            rows = db.session.query(Connection.connection_id, Connection.records) \
+                             .filter(Connection.connection_id > last) \
+                             .order_by(Connection.connection_id).limit(chunk_size).all()
+            if len(rows) == 0: break
+            for connection_id, records in rows:
+                kept = [ r for r in (records or []) if r >= oldest ][-max_records:]
+                if kept == (records or []): continue
+                Connection.query.filter_by(connection_id=connection_id) \
+                                .update({ Connection.records: kept }, synchronize_session=False)
+                trimmed += 1
+            commit(immediate=True)
+            last = rows[-1][0]
+        return deleted, trimmed
+
 
 class AccountEntity(db.Model):
     __tablename__ = "account"
-    user_id      = Column(SMALLINT(unsigned=True),  primary_key=True)
+    user_id      = Column(INTEGER(unsigned=True),   primary_key=True)
     username     = Column(VARCHAR(30), unique=True, nullable=False)
     password     = Column(TEXT(256),                nullable=False)
     display_name = Column(VARCHAR(30),              nullable=False)
@@ -74,38 +110,34 @@ class AccountEntity(db.Model):
     def register(self):
         # self.create_time = datetime.now()
         db.session.add(self)
-        db.session.commit()
+        commit()
         return
 
     def change_password(self, password):
         self.password = hashlib.sha224(str.encode(password)).hexdigest()
-        db.session.commit()
+        commit()
+        emit("account_changed", self)
         return
 
     def edit_information(self, display_name, email, phone):
         self.display_name = display_name
         self.email        = email
         self.phone        = phone
-        db.session.commit()
+        commit()
+        emit("account_changed", self)
         return
 
-    @property
-    def collection(self):
-        likes = LikesRelationship.query.filter_by(user_id=self.user_id).all()
-        likes = sorted(likes, key=lambda l: l.create_time, reverse=True)
-        return [
-            ProductEntity.query.filter_by(product_id=like.product_id).first().overview_json
-            for like in likes
-        ]
+    def collection(self, limit, after=None):
+        # One page of liked products, newest like first; `after` is the (create_time, product_id) of the last item seen
+        query = db.session.query(LikesRelationship.create_time, LikesRelationship.product_id) \
+                          .filter_by(user_id=self.user_id)
+        return ProductEntity.page(query, LikesRelationship.create_time, LikesRelationship.product_id, limit, after)
 
-    @property
-    def history(self):
-        seens = SeenRelationship.query.filter_by(user_id=self.user_id).all()
-        seens = sorted(seens, key=lambda s: s.recent_time, reverse=True)
-        return [
-            ProductEntity.query.filter_by(product_id=seen.product_id).first().overview_json
-            for seen in seens
-        ]
+    def history(self, limit, after=None):
+        # One page of viewed products, most recent view first; `after` is the (recent_time, product_id) of the last item seen
+        query = db.session.query(SeenRelationship.recent_time, SeenRelationship.product_id) \
+                          .filter_by(user_id=self.user_id)
+        return ProductEntity.page(query, SeenRelationship.recent_time, SeenRelationship.product_id, limit, after)
 
     # @property
     # def json(self):
@@ -123,7 +155,7 @@ class AccountEntity(db.Model):
 
 class BookEntity(db.Model):
     __tablename__ = "book"
-    book_id      = Column(SMALLINT(unsigned=True), primary_key=True)
+    book_id      = Column(INTEGER(unsigned=True),  primary_key=True)
     ISBN         = Column(VARCHAR(13), nullable=False, unique=True)
     create_time  = Column(DATETIME, default=datetime.now)
 
@@ -133,15 +165,21 @@ class BookEntity(db.Model):
     def register(self):
         # self.create_time = datetime.now()
         db.session.add(self)
-        db.session.commit()
+        commit()
         return
 
 
 class ProductEntity(db.Model):
     __tablename__ = "product"
-    product_id   = Column(SMALLINT(unsigned=True), primary_key=True)
-    book_id      = Column(SMALLINT(unsigned=True), nullable=False)  # BookEntity.book_id
-    seller_id    = Column(SMALLINT(unsigned=True), nullable=False)  # AccountEntity.user_id
+    __table_args__ = (
+        Index("ix_product_seller_update", "seller_id", "update_time"),
+        Index("ix_product_browse_price", "for_sale", "sold_out", "price"),
+        Index("ix_product_browse_update", "for_sale", "sold_out", "update_time"),
+        Index("ix_product_book_status_price", "book_id", "for_sale", "sold_out", "price"),
+    )
+    product_id   = Column(INTEGER(unsigned=True),  primary_key=True)
+    book_id      = Column(INTEGER(unsigned=True),  nullable=False)  # BookEntity.book_id
+    seller_id    = Column(INTEGER(unsigned=True),  nullable=False)  # AccountEntity.user_id
     name         = Column(VARCHAR(30),             nullable=False)
     price        = Column(SMALLINT(unsigned=True), nullable=False)
     # likes
@@ -154,19 +192,16 @@ class ProductEntity(db.Model):
     location     = Column(VARCHAR(30),             nullable=False)
     language     = Column(VARCHAR(10),             nullable=False)
     extra_desc   = Column(VARCHAR(1000),           nullable=False)
-    comments     = Column(JSON)  # A list of CommentEntity.comment_id
+    # comments: CommentEntity rows with this product_id (the former JSON list of ids is
+    #           backfilled by migration m0001_comment_product_id)
     update_time  = Column(DATETIME,                default=datetime.now)  # , onupdate=datetime.now)
     create_time  = Column(DATETIME,                default=datetime.now)
     # tags         = Column(JSON)
 
     def __init__(self, ISBN, seller_id, name, price, images, 
                  condition, noted, location, language, extra_desc):
-        book = BookEntity.query.filter_by(ISBN=ISBN).first()
-        if book is None:
-            book = BookEntity(ISBN)
-            book.register()
-            book = BookEntity.query.filter_by(ISBN=ISBN).first()
-        self.book_id    = book.book_id
+        from database.isbn import resolve_book_id
+        self.book_id    = resolve_book_id(ISBN)
         self.seller_id  = seller_id
         self.name       = name
         self.price      = price
@@ -178,49 +213,50 @@ class ProductEntity(db.Model):
         self.location   = location
         self.language   = language
         self.extra_desc = extra_desc
-        self.comments   = []
 
     def register(self):
         # self.update_time = datetime.now()
         # self.create_time = datetime.now()
         db.session.add(self)
-        db.session.commit()
+        db.session.flush()
+        db.session.add(ProductCounter(self.product_id))
+        commit()
+        emit("product_changed", self)
         return
 
     def add_comment(self, user_id, content):
-        comment = CommentEntity(user_id, content)
-        comment.register()
-        self.comments = self.comments + [ comment.comment_id ]
-        db.session.commit()
+        # A single INSERT, the product row itself is not rewritten
+        CommentEntity(self.product_id, user_id, content).register()
         return
 
     def launch(self):
         self.for_sale = True
         self.sold_out = False
         self.update_time = datetime.now()
-        db.session.commit()
+        # Browsing by likes joins the counters, a product on sale must have its row (a no-op upsert when it does)
+        ProductCounter.increase(self.product_id)
+        commit()
+        emit("product_changed", self)
         return
 
     def discontinue(self):
         self.for_sale = False
         self.update_time = datetime.now()
-        db.session.commit()
+        commit()
+        emit("product_changed", self)
         return
 
     def out_of_stock(self):
         self.sold_out = True
         self.update_time = datetime.now()
-        db.session.commit()
+        commit()
+        emit("product_changed", self)
         return
 
     def update(self, ISBN, name, price, images, condition,
                noted, location, language, extra_desc):
-        book = BookEntity.query.filter_by(ISBN=ISBN).first()
-        if book is None:
-            book = BookEntity(ISBN)
-            book.register()
-            book = BookEntity.query.filter_by(ISBN=ISBN).first()
-        self.book_id    = book.book_id
+        from database.isbn import resolve_book_id
+        self.book_id    = resolve_book_id(ISBN)
         self.name       = name
         self.price      = price
         self.images     = images
@@ -230,7 +266,8 @@ class ProductEntity(db.Model):
         self.language   = language
         self.extra_desc = extra_desc
         self.update_time = datetime.now()
-        db.session.commit()
+        commit()
+        emit("product_changed", self)
         return
 
     @property
@@ -243,72 +280,147 @@ class ProductEntity(db.Model):
 
     @property
     def likes(self):
-        return len(LikesRelationship.query.filter_by(product_id=self.product_id).all())
+        return ProductEntity.like_counts([ self.product_id ]).get(self.product_id, 0)
 
     @property
     def views(self):
-        return len(SeenRelationship.query.filter_by(product_id=self.product_id).all())
+        return ProductEntity.view_counts([ self.product_id ]).get(self.product_id, 0)
 
     @property
     def comments_json(self):
-        return [
-            CommentEntity.query.filter_by(comment_id=cid).first().json
-            for cid in self.comments
-        ]
+        from database.loader import ProductLoader
+        return ProductLoader([ self ]).comments.get(self.product_id, [])
 
     @property
     def overview_json(self):
-        return {
-            "productId"        : self.product_id,
-            "sellerDisplayName": self.seller.display_name,
-            "name"             : self.name,
-            "price"            : self.price,
-            "likes"            : self.likes,
-            "views"            : self.views,
-            "images"           : self.images,
-            "soldOut"          : self.sold_out,
-            "extraDescription" : self.extra_desc,
-        }
+        from database.loader import ProductLoader
+        return ProductLoader([ self ]).overview_json(self)
 
     @property
     def detail_json(self):
-        return {
-            "productId"        : self.product_id,
-            "ISBN"             : self.book.ISBN,
-            "sellerDisplayName": self.seller.display_name,
-            "name"             : self.name,
-            "price"            : self.price,
-            "likes"            : self.likes,
-            "views"            : self.views,
-            "images"           : self.images,
-            "forSale"          : self.for_sale,
-            "soldOut"          : self.sold_out,
-            "condition"        : self.condition,
-            "noted"            : self.noted,
-            "location"         : self.location,
-            "language"         : self.language,
-            "extraDescription" : self.extra_desc,
-            "comments"         : self.comments_json,
-            "createTime"       : self.create_time,
-            "updateTime"       : self.update_time,
-        }
+        from database.loader import ProductLoader
+        return ProductLoader([ self ]).detail_json(self)
+
+    @staticmethod
+    def page(query, time_column, id_column, limit, after=None):
+        # Keyset pagination over (time, product_id) descending, only the page itself is hydrated.
+        # `query` selects (time, product_id) rows; returns the overviews and the key of the last one if more remain.
+        from database.loader import ProductLoader
+        if after is not None:
+            time, product_id = after
+            query = query.filter(or_(time_column < time, and_(time_column == time, id_column < product_id)))
+        rows = query.order_by(time_column.desc(), id_column.desc()).limit(limit+1).all()
+        rows, has_more = rows[:limit], len(rows) > limit
+        products = ProductEntity.get_many([ pid for _, pid in rows ])
+        return ProductLoader(products).overview_jsons(), (tuple(rows[-1]) if has_more else None)
+
+    @staticmethod
+    def seller_page(seller_id, status, limit, after=None):
+        status_filter = {
+            "forSale": and_(ProductEntity.sold_out == False, ProductEntity.for_sale == True),
+            "editing": and_(ProductEntity.sold_out == False, ProductEntity.for_sale == False),
+            "soldOut": ProductEntity.sold_out == True,
+        }[status]
+        query = db.session.query(ProductEntity.update_time, ProductEntity.product_id) \
+                          .filter(ProductEntity.seller_id == seller_id, status_filter)
+        return ProductEntity.page(query, ProductEntity.update_time, ProductEntity.product_id, limit, after)
+
+    @staticmethod
+    def book_page(book_id, limit, after=None):
+        # Copies of a book on sale, cheapest first; keyset on (price, product_id) over ix_product_book_status_price.
+        # Returns the products and the key of the last one if more remain.
+        query = ProductEntity.query.filter(ProductEntity.book_id == book_id, ProductEntity.for_sale == True,
+                                           ProductEntity.sold_out == False)
+        if after is not None:
+            price, product_id = after
+            query = query.filter(or_(ProductEntity.price > price,
+                                     and_(ProductEntity.price == price, ProductEntity.product_id > product_id)))
+        products = query.order_by(ProductEntity.price, ProductEntity.product_id).limit(limit+1).all()
+        products, has_more = products[:limit], len(products) > limit
+        return products, ((products[-1].price, products[-1].product_id) if has_more else None)
+
+    @staticmethod
+    def browse(filters, sort, limit, after=None):
+        # For-sale products matching `filters` ("min_price", "max_price", "conditions", "noted", "language",
+        # "location"), keyset paginated on (sort key, product_id). Each sort walks its own index
+        # (ix_product_browse_price / ix_product_browse_update / ix_product_counter_likes, every product
+        # has a counter row) and checks the filters on the way.
+        # Returns the products and the key of the last one if more remain.
+        key_column, id_column, descending = {
+            "price"    : (ProductEntity.price,       ProductEntity.product_id,  False),
+            "priceDesc": (ProductEntity.price,       ProductEntity.product_id,  True),
+            "recent"   : (ProductEntity.update_time, ProductEntity.product_id,  True),
+            "likes"    : (ProductCounter.likes,      ProductCounter.product_id, True),
+        }[sort]
+        query = db.session.query(key_column, id_column)
+        if sort == "likes":
+            query = query.join(ProductEntity, ProductEntity.product_id == ProductCounter.product_id)
+        query = query.filter(ProductEntity.for_sale == True, ProductEntity.sold_out == False)
+        if filters.get("min_price")  is not None: query = query.filter(ProductEntity.price >= filters["min_price"])
+        if filters.get("max_price")  is not None: query = query.filter(ProductEntity.price <= filters["max_price"])
+        if filters.get("conditions") is not None: query = query.filter(ProductEntity.condition.in_(filters["conditions"]))
+        if filters.get("noted")      is not None: query = query.filter(ProductEntity.noted == filters["noted"])
+        if filters.get("language")   is not None: query = query.filter(ProductEntity.language == filters["language"])
+        if filters.get("location")   is not None: query = query.filter(ProductEntity.location == filters["location"])
+
+        if after is not None:
+            key, product_id = after
+            # The bound on the key alone gives the planner a range of the sort index to start from
+            if descending: query = query.filter(key_column <= key, or_(key_column < key, and_(key_column == key, id_column < product_id)))
+            else         : query = query.filter(key_column >= key, or_(key_column > key, and_(key_column == key, id_column > product_id)))
+        order = [ key_column.desc(), id_column.desc() ] if descending else [ key_column, id_column ]
+        rows = query.order_by(*order).limit(limit+1).all()
+        rows, has_more = rows[:limit], len(rows) > limit
+        products = ProductEntity.get_many([ pid for _, pid in rows ])
+        return products, (tuple(rows[-1]) if has_more else None)
+
+    @staticmethod
+    def get_many(product_ids):
+        # Products in the order of `product_ids`, with a single query
+        if len(product_ids) == 0: return []
+        products = ProductEntity.query.filter(ProductEntity.product_id.in_(product_ids)).all()
+        products = { p.product_id: p for p in products }
+        return [ products[pid] for pid in product_ids ]
+
+    @staticmethod
+    def counts(product_ids):
+        # product_id -> (likes, views)
+        return { pid: (likes, views) for pid, likes, views in
+                 db.session.query(ProductCounter.product_id, ProductCounter.likes, ProductCounter.views)
+                           .filter(ProductCounter.product_id.in_(product_ids)).all() }
+
+    @staticmethod
+    def like_counts(product_ids):
+        return dict(db.session.query(ProductCounter.product_id, ProductCounter.likes)
+                              .filter(ProductCounter.product_id.in_(product_ids)).all())
+
+    @staticmethod
+    def view_counts(product_ids):
+        return dict(db.session.query(ProductCounter.product_id, ProductCounter.views)
+                              .filter(ProductCounter.product_id.in_(product_ids)).all())
 
 
 class CommentEntity(db.Model):
     __tablename__ = "comment"
-    comment_id  = Column(SMALLINT(unsigned=True), primary_key=True)
-    user_id     = Column(SMALLINT(unsigned=True), nullable=False)  # user_id
+    __table_args__ = (
+        Index("ix_comment_product_time", "product_id", "create_time"),
+    )
+    comment_id  = Column(INTEGER(unsigned=True),  primary_key=True)
+    product_id  = Column(INTEGER(unsigned=True),  nullable=False)  # ProductEntity.product_id
+    user_id     = Column(INTEGER(unsigned=True),  nullable=False)  # user_id
     content     = Column(VARCHAR(100),            nullable=False)
     create_time = Column(DATETIME,                default=datetime.now)
 
-    def __init__(self, user_id, content):
-        self.user_id = user_id
-        self.content = content
+    def __init__(self, product_id, user_id, content):
+        self.product_id = product_id
+        self.user_id    = user_id
+        self.content    = content
 
     def register(self):
         # self.create_time = datetime.now()
         db.session.add(self)
-        db.session.commit()
+        commit()
+        emit("comment_created", self)
         return
 
     @property
@@ -323,8 +435,12 @@ class CommentEntity(db.Model):
 
 class NotificationEntity(db.Model):
     __tablename__ = "notification"
-    notification_id = Column(SMALLINT(unsigned=True), primary_key=True)
-    user_id         = Column(SMALLINT(unsigned=True), nullable=False)  # user_id
+    __table_args__ = (
+        Index("ix_notification_user_time", "user_id", "create_time"),
+        Index("ix_notification_user_read", "user_id", "read"),
+    )
+    notification_id = Column(INTEGER(unsigned=True),  primary_key=True)
+    user_id         = Column(INTEGER(unsigned=True),  nullable=False)  # user_id
     read            = Column(BOOLEAN,                 nullable=False)
     content         = Column(VARCHAR(100),            nullable=False)
     create_time     = Column(DATETIME,                default=datetime.now)
@@ -337,14 +453,37 @@ class NotificationEntity(db.Model):
     def register(self):
         # self.create_time = datetime.now()
         db.session.add(self)
-        db.session.commit()
+        commit()
+        emit("notification_created", self)
         return
 
     def update_read(self):
         self.read = True
-        db.session.commit()
+        commit()
         return
 
+    @staticmethod
+    def fetch(user_id, since=None, after_id=None):
+        # Newest first; `since` (datetime) and `after_id` only return what the client has not seen yet
+        query = NotificationEntity.query.filter(NotificationEntity.user_id == user_id)
+        if since    is not None: query = query.filter(NotificationEntity.create_time > since)
+        if after_id is not None: query = query.filter(NotificationEntity.notification_id > after_id)
+        return query.order_by(NotificationEntity.notification_id.desc()).all()
+
+    @staticmethod
+    def read_all(user_id):
+        # One bulk UPDATE instead of a commit per notification
+        updated = NotificationEntity.query.filter(NotificationEntity.user_id == user_id,
+                                                  NotificationEntity.read == False) \
+                                          .update({ NotificationEntity.read: True }, synchronize_session=False)
+        commit()
+        return updated
+
+    @staticmethod
+    def unread_count(user_id):
+        return NotificationEntity.query.filter(NotificationEntity.user_id == user_id,
+                                               NotificationEntity.read == False).count()
+
     @property
     def json(self):
         return {
@@ -354,10 +493,78 @@ class NotificationEntity(db.Model):
         }
 
 
+class ProductCounter(db.Model):
+    # Denormalized like/view counts, kept in step with LikesRelationship and SeenRelationship
+    __tablename__ = "product_counter"
+    __table_args__ = (
+        Index("ix_product_counter_likes", "likes"),
+    )
+    product_id = Column(INTEGER(unsigned=True),  primary_key=True)
+    likes      = Column(INTEGER(unsigned=True),  nullable=False, default=0)
+    views      = Column(INTEGER(unsigned=True),  nullable=False, default=0)
+
+    def __init__(self, product_id, likes=0, views=0):
+        self.product_id = product_id
+        self.likes      = likes
+        self.views      = views
+
+    @staticmethod
+    def increase(product_id, likes=0, views=0):
+        # One upsert incremented in SQL, so concurrent writers never lose an update nor both insert
+        # a missing row, and a count never goes below 0; committed by the caller
+        table = ProductCounter.__table__
+        values = { "product_id": product_id, "likes": max(likes, 0), "views": max(views, 0) }
+        counts = { "likes": ProductCounter._shifted(table.c.likes, likes),
+                   "views": ProductCounter._shifted(table.c.views, views) }
+        dialect = db.engine.dialect.name
+        if dialect == "mysql":
+            upsert = mysql.insert(table).values(values).on_duplicate_key_update(counts)
+        elif dialect == "sqlite":
+            upsert = sqlite.insert(table).values(values).on_conflict_do_update(index_elements=["product_id"], set_=counts)
+        else:
+            raise NotImplementedError(dialect)
+        db.session.execute(upsert)
+        return
+
+    @staticmethod
+    def _shifted(column, delta):
+        # column + delta floored at 0, without a negative intermediate value in the UNSIGNED column
+        if delta >= 0: return column + delta
+        return case((column > -delta, column + delta), else_=0)
+
+    @staticmethod
+    def reconcile():
+        # Rebuilds every counter from the relationship tables, returns how many rows were wrong or missing
+        likes = dict(db.session.query(LikesRelationship.product_id, func.count())
+                               .group_by(LikesRelationship.product_id).all())
+        views = dict(db.session.query(SeenRelationship.product_id, func.count())
+                               .group_by(SeenRelationship.product_id).all())
+        counters = { c.product_id: (c.likes, c.views) for c in ProductCounter.query.all() }
+        product_ids = [ pid for pid, in db.session.query(ProductEntity.product_id).all() ]
+        fixed = 0
+        for product_id in product_ids:
+            expected = (likes.get(product_id, 0), views.get(product_id, 0))
+            if counters.get(product_id) == expected: continue
+            fixed += 1
+            if product_id in counters:
+                ProductCounter.query.filter_by(product_id=product_id).update({
+                    ProductCounter.likes: expected[0],
+                    ProductCounter.views: expected[1],
+                }, synchronize_session=False)
+            else:
+                db.session.add(ProductCounter(product_id, *expected))
+        commit()
+        return fixed
+
+
 class SeenRelationship(db.Model):
     __tablename__ = "seen"
-    user_id     = Column(SMALLINT(unsigned=True), primary_key=True)
-    product_id  = Column(SMALLINT(unsigned=True), primary_key=True)
+    __table_args__ = (
+        Index("ix_seen_product", "product_id"),
+        Index("ix_seen_user_time", "user_id", "recent_time"),
+    )
+    user_id     = Column(INTEGER(unsigned=True),  primary_key=True)
+    product_id  = Column(INTEGER(unsigned=True),  primary_key=True)
     recent_time = Column(DATETIME,                default=datetime.now)
     create_time = Column(DATETIME,                default=datetime.now)
 
@@ -365,23 +572,15 @@ class SeenRelationship(db.Model):
         self.user_id    = user_id
         self.product_id = product_id
 
-    def register(self):
-        # self.recent_time = datetime.now()
-        # self.create_time = datetime.now()
-        db.session.add(self)
-        db.session.commit()
-        return
-
-    def update_time(self):
-        self.recent_time = datetime.now()
-        db.session.commit()
-        return
-
 
 class LikesRelationship(db.Model):
     __tablename__ = "likes"
-    user_id     = Column(SMALLINT(unsigned=True), primary_key=True)
-    product_id  = Column(SMALLINT(unsigned=True), primary_key=True)
+    __table_args__ = (
+        Index("ix_likes_product", "product_id"),
+        Index("ix_likes_user_time", "user_id", "create_time"),
+    )
+    user_id     = Column(INTEGER(unsigned=True),  primary_key=True)
+    product_id  = Column(INTEGER(unsigned=True),  primary_key=True)
     create_time = Column(DATETIME,                default=datetime.now)
 
     def __init__(self, user_id, product_id):
@@ -391,10 +590,14 @@ class LikesRelationship(db.Model):
     def register(self):
         # self.create_time = datetime.now()
         db.session.add(self)
-        db.session.commit()
+        ProductCounter.increase(self.product_id, likes=1)
+        commit()
+        emit("likes_changed", self.product_id, 1)
         return
 
     def remove(self):
         db.session.delete(self)
-        db.session.commit()
+        ProductCounter.increase(self.product_id, likes=-1)
+        commit()
+        emit("likes_changed", self.product_id, -1)
         return
\ No newline at end of file
@@ -0,0 +1,106 @@
+''' Libraries '''
+import time
+import itertools
+import threading
+from flask import g, request, current_app, has_request_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm
+from sqlalchemy.sql.dml import UpdateBase
+
+from utils.metrics import register_metrics
+
+
+
+''' Settings '''
+__all__ = ["RoutingSQLAlchemy", "RoutingSession", "use_primary", "STICKY_COOKIE"]
+STICKY_COOKIE = "db_primary_until"  # Set after a write, so the client's next reads see it
+READ_METHODS  = ("GET", "HEAD", "OPTIONS")
+_stats = { "primary": 0, "replica": 0, "stickyResponses": 0 }
+_stats_lock = threading.Lock()  # Guards _stats and the replica round-robin, shared by the request threads
+
+
+
+''' Functions '''
+def use_primary():
+    # Sends the rest of the current request to the primary (read-your-own-writes paths)
+    if has_request_context(): g.db_primary = True
+
+
+def _count(key):
+    with _stats_lock: _stats[key] += 1
+
+
+def _replica_allowed():
+    if not has_request_context(): return False  # CLI and background threads stay on the primary
+    if g.get("db_primary"): return False
+    if request.method not in READ_METHODS: return False
+    try:
+        return float(request.cookies.get(STICKY_COOKIE, 0)) < time.time()
+    except ValueError:
+        return True
+
+
+
+''' Classes '''
+class RoutingSession(SignallingSession):
+    # Built on Flask-SQLAlchemy 2.x (SignallingSession, get_engine(app, bind)), pinned in requirements.txt.
+    # Statements of read-only requests go to one replica per request. Flushes and bulk
+    # INSERT/UPDATE/DELETE go to the primary, and so does the rest of a request after its first write.
+
+    def __init__(self, db, **options):
+        self.db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing or isinstance(clause, UpdateBase):
+            if has_request_context(): g.db_primary = g.db_wrote = True
+        elif _replica_allowed():
+            if "db_replica" not in g: g.db_replica = self.db.next_replica(self.app)
+            if g.db_replica is not None:
+                _count("replica")
+                return g.db_replica
+        _count("primary")
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    # Reads are spread over the engines in SQLALCHEMY_REPLICA_URIS, registered as the binds
+    # "replica0", "replica1", ... so they share SQLALCHEMY_ENGINE_OPTIONS with the primary.
+
+    def init_app(self, app):
+        replicas = app.config.setdefault("SQLALCHEMY_REPLICA_URIS", [])
+        app.config.setdefault("SQLALCHEMY_REPLICA_STICKY", 5)  # Seconds on the primary after a write
+        binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+        binds.update({ f"replica{i}": uri for i, uri in enumerate(replicas) })
+        app.config["SQLALCHEMY_BINDS"] = binds
+        app.extensions["sqlalchemy_replicas"] = itertools.cycle(range(len(replicas))) if replicas else None
+        app.after_request(self._stick_to_primary)
+        super().init_app(app)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def next_replica(self, app):
+        # Round-robin over the replicas, None when none are configured
+        replicas = app.extensions.get("sqlalchemy_replicas")
+        if replicas is None: return None
+        with _stats_lock: index = next(replicas)
+        return self.get_engine(app, bind=f"replica{index}")
+
+    @staticmethod
+    def _stick_to_primary(response):
+        # After a successful write the client reads from the primary long enough for the replicas
+        # to catch up. Writes made while serving a read (recording a view) do not count.
+        if g.get("db_wrote") and request.method not in READ_METHODS and response.status_code < 400:
+            window = current_app.config["SQLALCHEMY_REPLICA_STICKY"]
+            response.set_cookie(STICKY_COOKIE, str(time.time() + window), max_age=int(window),
+                                httponly=True, samesite="None", secure=True)
+            _count("stickyResponses")
+        return response
+
+
+def _routing_stats():
+    with _stats_lock: return dict(_stats)
+
+
+register_metrics("databaseRouting", _routing_stats)
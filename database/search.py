@@ -0,0 +1,193 @@
+''' Libraries '''
+import os
+import time
+import threading
+from collections import defaultdict, Counter
+
+from database.events import subscribe
+from database.model import db, AccountEntity, ProductEntity
+
+
+
+''' Parameters '''
+SEARCH_INDEX_REFRESH = int(os.environ.get("SEARCH_INDEX_REFRESH", 60))  # Seconds between rebuilds from the DB
+
+
+
+''' Settings '''
+__all__ = ["tokenize", "rank_key", "SearchIndex", "search_index"]
+NGRAM = 2
+NAME_WEIGHT   = 100000
+DESC_WEIGHT   = 1000
+SELLER_WEIGHT = 100
+LIKES_WEIGHT  = 10
+VIEWS_WEIGHT  = 1
+
+
+
+''' Functions '''
+def tokenize(text, n=NGRAM):
+    # Character n-grams (1..n) work for CJK titles without a word segmenter
+    # and double as substring candidates for latin keywords.
+    grams = set()
+    for size in range(1, n+1):
+        grams.update(text[i:i+size] for i in range(len(text)-size+1))
+    return grams
+
+
+def query_grams(keyword, n=NGRAM):
+    size = min(len(keyword), n)
+    return set(keyword[i:i+size] for i in range(len(keyword)-size+1))
+
+
+def rank_key(result):
+    product_id, score, sold_out = result
+    return (int(sold_out), -score, product_id)
+
+
+class _FieldIndex():
+    def __init__(self):
+        self.texts    = {}  # doc_id -> text
+        self.postings = defaultdict(set)
+
+    def add(self, doc_id, text):
+        if self.texts.get(doc_id) == text: return
+        self.remove(doc_id)
+        self.texts[doc_id] = text
+        for gram in tokenize(text):
+            self.postings[gram].add(doc_id)
+
+    def remove(self, doc_id):
+        text = self.texts.pop(doc_id, None)
+        if text is None: return
+        for gram in tokenize(text):
+            docs = self.postings[gram]
+            docs.discard(doc_id)
+            if len(docs) == 0: del self.postings[gram]
+
+    def match(self, keyword):
+        # Same semantics as `keyword in text`: n-gram postings give the
+        # candidates, a substring check on the stored text confirms them.
+        if keyword == '': return set(self.texts)
+        candidates = None
+        for gram in query_grams(keyword):
+            docs = self.postings.get(gram)
+            if not docs: return set()
+            candidates = set(docs) if candidates is None else candidates & docs
+            if len(candidates) == 0: return candidates
+        if len(keyword) <= NGRAM: return candidates
+        return set(d for d in candidates if keyword in self.texts[d])
+
+
+class SearchIndex():
+    # Kept in step by the product and account events of this process; the periodic rebuild picks up
+    # the listings and display names changed by other worker processes.
+
+    def __init__(self):
+        self.lock     = threading.RLock()
+        self.built_at = None
+
+    def build(self):
+        with self.lock:
+            self.products = {}  # product_id -> (seller_id, for_sale, sold_out)
+            self.names    = _FieldIndex()
+            self.descs    = _FieldIndex()
+            self.sellers  = _FieldIndex()  # Keyed by seller_id
+            self.seller_products = defaultdict(set)
+            rows = db.session.query(ProductEntity.product_id, ProductEntity.seller_id,
+                                    ProductEntity.name, ProductEntity.extra_desc,
+                                    ProductEntity.for_sale, ProductEntity.sold_out).all()
+            for product_id, seller_id, name, extra_desc, for_sale, sold_out in rows:
+                self._add_product(product_id, seller_id, name, extra_desc, for_sale, sold_out)
+            seller_ids = list(self.seller_products)
+            if len(seller_ids) > 0:
+                for user_id, display_name in db.session.query(AccountEntity.user_id, AccountEntity.display_name) \
+                                                       .filter(AccountEntity.user_id.in_(seller_ids)).all():
+                    self.sellers.add(user_id, display_name)
+            self.built_at = time.monotonic()
+        return
+
+    def _ensure_built(self):
+        if self.built_at is None or time.monotonic() - self.built_at > SEARCH_INDEX_REFRESH:
+            self.build()
+
+    def _add_product(self, product_id, seller_id, name, extra_desc, for_sale, sold_out):
+        old = self.products.get(product_id)
+        if old is not None and old[0] != seller_id:
+            self.seller_products[old[0]].discard(product_id)
+        self.products[product_id] = (seller_id, for_sale, sold_out)
+        self.seller_products[seller_id].add(product_id)
+        self.names.add(product_id, name)
+        self.descs.add(product_id, extra_desc)
+
+    def update_product(self, product):
+        with self.lock:
+            if self.built_at is None: return
+            self._add_product(product.product_id, product.seller_id, product.name,
+                              product.extra_desc, product.for_sale, product.sold_out)
+            if product.seller_id not in self.sellers.texts:
+                self.sellers.add(product.seller_id, product.seller.display_name)
+        return
+
+    def update_seller(self, user_id, display_name):
+        with self.lock:
+            if self.built_at is None or user_id not in self.seller_products: return
+            self.sellers.add(user_id, display_name)
+        return
+
+    def search(self, keywords):
+        # Returns (product_id, score, sold_out) ordered like the original linear scan: products
+        # for sale first, then sold-out ones, each by the weighted keyword score with likes and views.
+        with self.lock:
+            self._ensure_built()
+            name_hits, desc_hits, seller_hits = Counter(), Counter(), Counter()
+            matches = {}
+            for keyword in keywords:
+                if keyword not in matches:
+                    sellers = self.sellers.match(keyword)
+                    matches[keyword] = (
+                        self.names.match(keyword),
+                        self.descs.match(keyword),
+                        set().union(*[ self.seller_products[s] for s in sellers ]),
+                    )
+                names, descs, seller_docs = matches[keyword]
+                name_hits.update(names)
+                desc_hits.update(descs)
+                seller_hits.update(seller_docs)
+
+            for_sale, sold_out = [], []
+            for product_id in set(name_hits) | set(desc_hits) | set(seller_hits):
+                _, is_for_sale, is_sold_out = self.products[product_id]
+                if is_sold_out:
+                    if name_hits[product_id] or desc_hits[product_id]:
+                        sold_out.append(product_id)
+                elif is_for_sale:
+                    for_sale.append(product_id)
+
+        product_ids = for_sale + sold_out
+        counts = ProductEntity.counts(product_ids) if len(product_ids) > 0 else {}
+
+        def score(product_id, with_seller):
+            likes, views = counts.get(product_id, (0, 0))
+            return name_hits[product_id]   * NAME_WEIGHT + \
+                   desc_hits[product_id]   * DESC_WEIGHT + \
+                   seller_hits[product_id] * SELLER_WEIGHT * int(with_seller) + \
+                   likes * LIKES_WEIGHT + \
+                   views * VIEWS_WEIGHT
+
+        for_sale = sorted([ (pid, score(pid, True),  False) for pid in for_sale ], key=rank_key)
+        sold_out = sorted([ (pid, score(pid, False), True)  for pid in sold_out ], key=rank_key)
+        return for_sale + sold_out
+
+
+search_index = SearchIndex()
+
+
+@subscribe("product_changed")
+def _on_product_changed(product):
+    search_index.update_product(product)
+
+
+@subscribe("account_changed")
+def _on_account_changed(account):
+    search_index.update_seller(account.user_id, account.display_name)
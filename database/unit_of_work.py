@@ -0,0 +1,114 @@
+''' Libraries '''
+import logging
+import threading
+from flask import g, current_app, has_request_context
+
+from database import events
+from utils.metrics import register_metrics
+
+
+
+''' Settings '''
+__all__ = ["commit", "emit", "init_app"]
+_lock  = threading.Lock()
+_stats = { "requests": 0, "commits": 0, "immediateCommits": 0, "rollbacks": 0 }
+
+
+
+''' Classes '''
+class _UnitOfWork():
+    # Per-request state: whether anything was staged, and the events waiting for the commit
+    def __init__(self):
+        self.staged = False
+        self.events = []
+
+
+
+''' Functions '''
+def _current():
+    return g.get("unit_of_work") if has_request_context() else None
+
+
+def _count(key):
+    with _lock: _stats[key] += 1
+
+
+def commit(immediate=False):
+    # Inside a request the changes are only flushed, so constraint errors still surface in the
+    # caller, and the whole request is committed once after the response is built. Outside a
+    # request (CLI, background threads) or with `immediate=True` the session is committed now.
+    from database.model import db
+    unit = _current()
+    if unit is not None and not immediate:
+        db.session.flush()
+        unit.staged = True
+        return
+    db.session.commit()
+    if unit is not None:
+        _count("immediateCommits")
+        _publish(unit)
+    return
+
+
+def emit(event, *args, **kwargs):
+    # Events describe committed state, so inside a request they wait for the commit
+    unit = _current()
+    if unit is not None:
+        unit.events.append((event, args, kwargs))
+    else:
+        events.emit(event, *args, **kwargs)
+
+
+def _publish(unit):
+    pending, unit.events = unit.events, []
+    for event, args, kwargs in pending:
+        events.emit(event, *args, **kwargs)
+
+
+def _begin():
+    g.unit_of_work = _UnitOfWork()
+
+
+def _finish(response):
+    from database.model import db
+    unit = _current()
+    if unit is None: return response
+    g.unit_of_work = None
+    _count("requests")
+    if not unit.staged: return response
+    if response.status_code >= 400:
+        db.session.rollback()
+        _count("rollbacks")
+        return response
+    try:
+        db.session.commit()
+        _count("commits")
+    except Exception as ex:
+        db.session.rollback()
+        _count("rollbacks")
+        logging.getLogger(name="flask").error(f"Unknown exception: {str(ex)} (unit of work commit)")
+        on_commit_error = current_app.extensions["unit_of_work"]
+        if on_commit_error is None: raise
+        return on_commit_error(ex)
+    _publish(unit)
+    return response
+
+
+def _teardown(exception):
+    # Unhandled exceptions skip `after_request`, so whatever was staged is dropped here
+    if _current() is not None:
+        from database.model import db
+        g.unit_of_work = None
+        db.session.rollback()
+
+
+def init_app(app, on_commit_error=None):
+    # `on_commit_error(exception)` turns a failed commit into the response sent instead,
+    # without it the exception propagates to Flask
+    app.extensions["unit_of_work"] = on_commit_error
+    app.before_request(_begin)
+    app.after_request(_finish)
+    app.teardown_request(_teardown)
+
+
+register_metrics("unitOfWork", lambda: dict(_stats))
@@ -0,0 +1,199 @@
+''' Libraries '''
+import os
+import time
+import atexit
+import logging
+import threading
+from datetime import datetime
+from sqlalchemy import tuple_, bindparam, func
+from sqlalchemy.dialects import mysql, sqlite
+
+from database.model import db, ProductCounter, SeenRelationship
+from database.unit_of_work import commit
+from utils.metrics import register_metrics
+
+
+
+''' Parameters '''
+VIEW_BUFFER_SIZE    = int(os.environ.get("VIEW_BUFFER_SIZE", 10000))     # Distinct pending (user, product) pairs
+VIEW_FLUSH_EVENTS   = int(os.environ.get("VIEW_FLUSH_EVENTS", 500))      # Pending pairs that trigger an early flush
+VIEW_FLUSH_INTERVAL = float(os.environ.get("VIEW_FLUSH_INTERVAL", 0.3))  # Seconds between flushes
+VIEW_LATE_AFTER     = float(os.environ.get("VIEW_LATE_AFTER", 5.0))      # Seconds after which a flushed view counts as late
+
+
+
+''' Settings '''
+__all__ = ["ViewBuffer", "view_buffer"]
+SQL_IN_LIMIT = 400  # Pairs per (user_id, product_id) IN (...) list, two bound parameters each
+
+
+
+''' Classes '''
+class ViewBuffer():
+    # Write-behind for the view history: `record` only stores the (user_id, product_id) pair in memory,
+    # where repeated views of a product coalesce, and a background thread writes the pending pairs
+    # with one batched upsert into `seen` and one batched counter update per flush. When the buffer
+    # is full, new pairs are dropped rather than blocking the request. Another worker may insert the
+    # same pair between the lookup and the upsert, `ProductCounter.reconcile` repairs the view count.
+
+    def __init__(self, maxsize=VIEW_BUFFER_SIZE, flush_events=VIEW_FLUSH_EVENTS, interval=VIEW_FLUSH_INTERVAL):
+        self.maxsize      = maxsize
+        self.flush_events = flush_events
+        self.interval     = interval
+        self.lock         = threading.Lock()
+        self.flush_lock   = threading.Lock()
+        self.start_lock   = threading.Lock()
+        self.wakeup       = threading.Event()
+        self.pending      = {}  # (user_id, product_id) -> (time of the latest view, time.monotonic() of the first)
+        self.thread       = None
+        self.pid          = None  # Process the flush thread runs in
+        self.app          = None
+        self.recorded     = 0
+        self.coalesced    = 0
+        self.dropped      = 0
+        self.late         = 0
+        self.flushed      = 0
+        self.flushes      = 0
+        self.failures     = 0
+        self.max_lag      = 0.0
+
+    def init_app(self, app):
+        self.app = app
+        atexit.register(self.stop)
+
+    def _started(self):
+        # The flush thread is started by the first view in each process: one started at import would
+        # stay in the master of a pre-fork server (gunicorn --preload) and be missing from the workers
+        if self.app is None: return False
+        if self.pid != os.getpid():
+            with self.start_lock:
+                if self.pid != os.getpid():
+                    self.pending = {}
+                    self.thread  = threading.Thread(target=self._run, name="view-buffer", daemon=True)
+                    self.thread.start()
+                    self.pid = os.getpid()
+        return True
+
+    def record(self, user_id, product_id):
+        # Returns False if the view was dropped. Without init_app (scripts, manage.py) it is written at once.
+        if not self._started():
+            self._write({ (user_id, product_id): (datetime.now(), time.monotonic()) })
+            return True
+        key = (user_id, product_id)
+        with self.lock:
+            self.recorded += 1
+            if key in self.pending:
+                self.coalesced += 1
+                self.pending[key] = (datetime.now(), self.pending[key][1])
+                return True
+            if len(self.pending) >= self.maxsize:
+                self.dropped += 1
+                return False
+            self.pending[key] = (datetime.now(), time.monotonic())
+            if len(self.pending) >= self.flush_events: self.wakeup.set()
+        return True
+
+    def _run(self):
+        while self.thread is not None:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def stop(self):
+        # Flushes what is still pending when the process exits
+        if self.pid != os.getpid(): return
+        thread, self.thread = self.thread, None
+        if thread is None: return
+        self.wakeup.set()
+        thread.join(timeout=10)
+        self.flush()
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                views, self.pending = self.pending, {}
+            if len(views) == 0: return 0
+            try:
+                with self.app.app_context():
+                    self._write(views)
+            except Exception as ex:
+                logging.error(f"View buffer flush of {len(views)} views failed: {str(ex)}")
+                self._requeue(views)
+                return 0
+            now = time.monotonic()
+            with self.lock:
+                lag = max(now - first for _, first in views.values())
+                self.late    += sum(1 for _, first in views.values() if now - first > VIEW_LATE_AFTER)
+                self.max_lag  = max(self.max_lag, lag)
+                self.flushed += len(views)
+                self.flushes += 1
+            return len(views)
+
+    def _requeue(self, views):
+        # Failed views go back in front of the newer ones, up to the buffer bound
+        with self.lock:
+            self.failures += 1
+            for key, (recent_time, first) in views.items():
+                if key in self.pending:
+                    self.pending[key] = (self.pending[key][0], first)
+                elif len(self.pending) < self.maxsize:
+                    self.pending[key] = (recent_time, first)
+                else:
+                    self.dropped += 1
+
+    def _write(self, views):
+        pairs = list(views)
+        existing = set()
+        for i in range(0, len(pairs), SQL_IN_LIMIT):
+            existing.update(db.session.query(SeenRelationship.user_id, SeenRelationship.product_id)
+                                      .filter(tuple_(SeenRelationship.user_id, SeenRelationship.product_id)
+                                              .in_(pairs[i:i+SQL_IN_LIMIT])).all())
+        rows = [ { "user_id": user_id, "product_id": product_id, "recent_time": recent_time, "create_time": recent_time }
+                 for (user_id, product_id), (recent_time, _) in views.items() ]
+        db.session.execute(_upsert(), rows)
+
+        # A first view of a product by a user counts as one more view of the product
+        new_views = {}
+        for user_id, product_id in pairs:
+            if (user_id, product_id) not in existing: new_views[product_id] = new_views.get(product_id, 0) + 1
+        if len(new_views) > 0:
+            counters = ProductCounter.__table__
+            db.session.execute(counters.update().where(counters.c.product_id == bindparam("pid"))
+                                                .values(views=counters.c.views + bindparam("count")),
+                               [ { "pid": pid, "count": count } for pid, count in new_views.items() ])
+        commit()
+
+    @property
+    def stats(self):
+        with self.lock:
+            return {
+                "pending"  : len(self.pending),
+                "recorded" : self.recorded,
+                "coalesced": self.coalesced,
+                "dropped"  : self.dropped,
+                "late"     : self.late,
+                "flushed"  : self.flushed,
+                "flushes"  : self.flushes,
+                "failures" : self.failures,
+                "maxLagMs" : round(self.max_lag * 1000, 1),
+            }
+
+
+
+''' Functions '''
+def _upsert():
+    # INSERT of the new pairs that moves `recent_time` of the existing ones forward
+    table = SeenRelationship.__table__
+    dialect = db.engine.dialect.name
+    if dialect == "mysql":
+        insert = mysql.insert(table)
+        return insert.on_duplicate_key_update(recent_time=func.GREATEST(table.c.recent_time, insert.inserted.recent_time))
+    if dialect == "sqlite":
+        insert = sqlite.insert(table)
+        return insert.on_conflict_do_update(index_elements=["user_id", "product_id"],
+                                            set_={ "recent_time": func.max(table.c.recent_time, insert.excluded.recent_time) })
+    raise NotImplementedError(dialect)
+
+
+view_buffer = ViewBuffer()
+register_metrics("viewBuffer", lambda: view_buffer.stats)
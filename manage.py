@@ -0,0 +1,90 @@
+''' Libraries '''
+import os
+import argparse
+import tempfile
+
+from app import app
+from database.model import db, AccountEntity, ProductCounter
+from database.migrate import migrate
+from database.importer import read_rows, import_products
+from database.compaction import ConnectionCompactor, CONNECTION_TTL, CONNECTION_MAX_RECORDS
+from api.utils.rate_limit import check_shared_memory, RATE_LIMIT_SHM_PATH
+
+
+
+''' Commands '''
+def run_migrations(args):
+    with app.app_context():
+        applied = migrate(db.engine)
+    print(f"Applied {len(applied)} migration(s): {', '.join(applied) or '-'}")
+
+
+def reconcile_counters(args):
+    with app.app_context():
+        fixed = ProductCounter.reconcile()
+    print(f"Reconciled like/view counters: {fixed} product(s) corrected.")
+
+
+def compact_connections(args):
+    with app.app_context():
+        deleted, trimmed = ConnectionCompactor(args.ttl, args.max_records).run()
+    print(f"Compacted connections: {deleted} idle row(s) deleted, {trimmed} row(s) with stale records trimmed.")
+
+
+def check_rate_limit(args):
+    # On a scratch file next to RATE_LIMIT_SHM_PATH: the live counters are left alone
+    directory = os.path.dirname(os.path.abspath(RATE_LIMIT_SHM_PATH)) if RATE_LIMIT_SHM_PATH else None
+    descriptor, path = tempfile.mkstemp(prefix="rate_limit_check.", dir=directory)
+    os.close(descriptor)
+    try:
+        total = check_shared_memory(path, args.processes, args.hits)
+    except AssertionError as ex:
+        raise SystemExit(f"Shared-memory rate limit diverged: {ex}")
+    finally:
+        if os.path.exists(path): os.remove(path)
+    print(f"Shared-memory rate limit: {args.processes} processes counted {total} hits exactly.")
+
+
+def import_product_file(args):
+    format = args.format or ("csv" if args.file.lower().endswith(".csv") else "jsonl")
+    with open(args.file, encoding="utf-8", newline='') as file:
+        rows = read_rows(file, format)
+    with app.app_context():
+        seller = AccountEntity.query.filter_by(username=args.seller).first()
+        if seller is None: raise SystemExit(f"Unknown seller '{args.seller}'.")
+        imported, errors = import_products(seller.user_id, rows, format, args.chunk_size)
+    for error in errors:
+        print(f"Row {error['row']+1}: {error['error']}")
+    print(f"Imported {imported} product(s) for '{args.seller}', {len(errors)} row(s) rejected.")
+
+
+
+''' Run '''
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NTNU Second-Hand Bookstore maintenance commands.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("migrate", help="Apply pending schema migrations.") \
+              .set_defaults(function=run_migrations)
+    subparsers.add_parser("reconcile-counters", help="Rebuild product like/view counters from the relationship tables.") \
+              .set_defaults(function=reconcile_counters)
+
+    compactor = subparsers.add_parser("compact-connections", help="Delete idle rate-limiter targets and trim their records.")
+    compactor.add_argument("--ttl", type=int, default=CONNECTION_TTL, help="Seconds without a ban before a target is deleted.")
+    compactor.add_argument("--max-records", type=int, default=CONNECTION_MAX_RECORDS, help="Timestamps kept per target.")
+    compactor.set_defaults(function=compact_connections)
+
+    checker = subparsers.add_parser("check-rate-limit", help="Check that worker processes share exact rate-limit counts on this host.")
+    checker.add_argument("--processes", type=int, default=8)
+    checker.add_argument("--hits", type=int, default=1000, help="Requests per process.")
+    checker.set_defaults(function=check_rate_limit)
+
+    importer = subparsers.add_parser("import-products", help="Bulk import listings from a CSV or JSONL file.")
+    importer.add_argument("file", help="CSV with a header of the JSON keys of /member/products/new, or JSONL.")
+    importer.add_argument("--seller", required=True, help="Username of the seller.")
+    importer.add_argument("--format", choices=["csv", "jsonl"], help="Defaults to the file extension.")
+    importer.add_argument("--chunk-size", type=int, default=1000, help="Products per INSERT and commit.")
+    importer.set_defaults(function=import_product_file)
+
+    args = parser.parse_args()
+    args.function(args)
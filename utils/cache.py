@@ -0,0 +1,64 @@
+''' Libraries '''
+import time
+import threading
+from collections import OrderedDict
+
+
+
+''' Settings '''
+__all__ = ["TTLCache"]
+
+
+
+''' Classes '''
+class TTLCache():
+    # Thread-safe LRU cache whose entries also expire after `ttl` seconds
+    def __init__(self, maxsize=1024, ttl=60):
+        self.lock    = threading.Lock()
+        self.maxsize = maxsize
+        self.ttl     = ttl
+        self.entries = OrderedDict()  # key -> (expire_time, value)
+        self.hits    = 0
+        self.misses  = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None: del self.entries[key]
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return
+
+    def pop(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+        return None if entry is None else entry[1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+        return
+
+    @property
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size"   : len(self.entries),
+                "maxsize": self.maxsize,
+                "hits"   : self.hits,
+                "misses" : self.misses,
+                "hitRate": self.hits / total if total > 0 else 0.0,
+            }
@@ -23,4 +23,7 @@ class ProductAccessInvalidException(Exception):
     pass
 
 class DataInvalidException(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class CursorInvalidException(ValueError):
+    pass
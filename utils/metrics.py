@@ -0,0 +1,14 @@
+''' Settings '''
+__all__ = ["register_metrics", "collect_metrics"]
+_providers = {}
+
+
+
+''' Functions '''
+def register_metrics(name, provider):
+    # `provider` is called on every collection and returns a JSON-serializable value
+    _providers[name] = provider
+
+
+def collect_metrics():
+    return { name: provider() for name, provider in _providers.items() }
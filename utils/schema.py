@@ -0,0 +1,101 @@
+''' Libraries '''
+import re
+
+
+
+''' Settings '''
+__all__ = ["type_map", "camel_case", "SchemaError", "Schema"]
+type_map = {
+    "int" : int,
+    "list": list,
+    "str" : str,
+    "dict": dict,
+    "bool": bool,
+    "None": type(None)
+}
+# "[type]", "[type][[item type]]" and either followed by "([min]..[max])", e.g. "list[str](..10)"
+TYPE_SPEC = re.compile(r"\s*(\w+)\s*(?:\[(.+)\])?\s*(?:\(\s*(-?\d*)\s*\.\.\s*(-?\d*)\s*\))?\s*")
+SIZED     = (str, list, dict)
+
+
+
+''' Functions '''
+def camel_case(name):
+    # "extra_description" -> "extraDescription", "ISBN" -> "ISBN"
+    first, *rest = filter(bool, name.split('_'))
+    return first + ''.join(map(str.capitalize, rest))
+
+
+def _compile(type_spec, key, message):
+    # "[type spec]" -> check(value) returning the value or raising SchemaError; runs once per field
+    match = TYPE_SPEC.fullmatch(type_spec)
+    if match is None or match.group(1) not in type_map: raise ValueError(f"Invalid type '{type_spec}' of '{key}'.")
+    base, item_spec, low, high = match.groups()
+    value_type = type_map[base]
+    low  = int(low)  if low  else None
+    high = int(high) if high else None
+    if item_spec is not None and value_type not in (list, dict): raise ValueError(f"'{base}' of '{key}' has no items.")
+    if (low is not None or high is not None) and value_type not in SIZED + (int,):
+        raise ValueError(f"'{base}' of '{key}' has no range.")
+    item_check = _compile(item_spec, key, message) if item_spec is not None else None
+    type_error = f"Requested Value With Wrong Type ({key})."
+
+    # Only the steps a field needs are chained, a bare "key: type" is a single type comparison
+    def check_type(value):
+        if type(value) is not value_type: raise SchemaError(key, "type", type_error)
+        return value
+    check = check_type
+
+    if low is not None or high is not None:
+        low, high = -float("inf") if low is None else low, float("inf") if high is None else high
+        size = len if value_type in SIZED else (lambda value: value)
+        def check_range(value, previous=check):
+            value = previous(value)
+            if not low <= size(value) <= high: raise SchemaError(key, "invalid", message)
+            return value
+        check = check_range
+
+    if item_check is not None:
+        def check_items(value, previous=check):
+            value = previous(value)
+            for item in (value.values() if value_type is dict else value): item_check(item)
+            return value
+        check = check_items
+    return check
+
+
+
+''' Classes '''
+class SchemaError(ValueError):
+    # `kind` is "type" for a missing value or one of the wrong type, "invalid" for a broken constraint
+    def __init__(self, key, kind, message):
+        super().__init__(message)
+        self.key  = key
+        self.kind = kind
+
+
+class Schema():
+    # Compiled once from "key: type" specs, then `validate` checks a payload in one pass over the fields.
+    # Python names are looked up by their camelCase JSON key; a spec without a type accepts anything,
+    # including a missing key. `messages` replaces "<key> invalid." for the broken constraints of a field.
+    # Another Schema may be given among the specs to include its fields.
+    #   Schema("name: str(1..30)", "price: int(0..65535)", "images: list[str](..10)", "cursor")
+
+    def __init__(self, *specs, messages=None):
+        messages = messages or {}
+        self.fields = []  # (python name, JSON key, check)
+        for spec in specs:
+            if isinstance(spec, Schema):
+                self.fields.extend(spec.fields)
+                continue
+            name, *type_spec = spec.split(':', 1)
+            name, key = name.strip(), camel_case(name.strip())
+            if len(type_spec) == 0:
+                self.fields.append((name, key, lambda value: value))
+            else:
+                self.fields.append((name, key, _compile(type_spec[0], key, messages.get(name, f"{key} invalid."))))
+
+    def validate(self, data):
+        # Returns { python name: value }, raises SchemaError for the first field that fails
+        if not hasattr(data, "get"): raise SchemaError(None, "type", "Requested Value With Wrong Type.")
+        return { name: check(data.get(key)) for name, key, check in self.fields }